@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown 处理热点路径的基准测试
+
+对以下函数分别计时：
+  extract_terms   replace_terms.extract_terms_and_links（解析 termlink.md）
+  term_matcher    replace_terms.TermMatcher（由术语字典构建匹配自动机）
+  add_links       replace_terms.add_links_to_content（逐个文档添加术语链接）
+  update_links    update_md_links.update_markdown_links（逐个文档替换本地 .md 引用）
+
+语料可以是按参数生成的合成文档（文档数、术语数、文档大小、代码块比例、链接密度均可配置，
+相同的 --seed 生成相同的语料），也可以是仓库中真实的 docs 目录。
+输出吞吐（MB/s、文件/s）、单个文件耗时的 p50/p95 和 tracemalloc 统计的内存峰值，
+结果可保存为 JSON，并与之前保存的结果对比。
+
+用法:
+  python bench_markdown.py                                   # 合成语料 + 真实 docs
+  python bench_markdown.py --corpus synthetic --docs 500 --terms 2000 --code-density 0.4
+  python bench_markdown.py -o bench-new.json --compare bench-old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from replace_terms import (DEFAULT_TERMLINK_PATH, TermMatcher, add_links_to_content,
+                           extract_terms_and_links)
+from update_md_links import ARTICLE_URL, canonical_path, update_markdown_links
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BASE_DIR / "docs"
+
+TAG_URL = "https://learnblockchain.cn/tags/{}?map=EVM"
+
+# 合成文档使用的词汇
+LATIN_WORDS = ['Solidity', 'EVM', 'Gas', 'ERC20', 'ERC721', 'Uniswap', 'Layer2', 'Rollup', 'Merkle',
+               'Keccak256', 'ABI', 'Foundry', 'Hardhat', 'OpenZeppelin', 'Proxy', 'Oracle', 'Nonce',
+               'Calldata', 'Storage', 'Memory', 'Event', 'Modifier', 'Mapping', 'Struct', 'Enum']
+CJK_WORDS = ['以太坊', '智能合约', '代币', '钱包', '区块', '交易', '哈希', '签名', '共识', '节点',
+             '预言机', '跨链', '质押', '治理', '流动性', '去中心化', '编译器', '虚拟机', '账户', '私钥']
+FILLER = ['的', '是', '在', '可以', '通过', '使用', '我们', '这个', '函数', '调用', '返回', '变量',
+          '如果', '那么', '需要', '例如', '其中', '实现', '部署', '测试']
+CODE_LINES = ['function transfer(address to, uint256 amount) public returns (bool) {',
+              '    require(balanceOf[msg.sender] >= amount, "Insufficient balance");',
+              '    balanceOf[msg.sender] -= amount;',
+              '    emit Transfer(msg.sender, to, amount);',
+              '}',
+              'mapping(address => uint256) public balanceOf;',
+              '// 以太坊 Gas ERC20 代币',
+              'forge test -vvv']
+
+
+def make_glossary(terms, seed=0):
+    """生成 terms 个术语的词汇表，返回 {术语: 链接}"""
+    rng = random.Random(seed)
+    glossary = {}
+    for word in LATIN_WORDS + CJK_WORDS:
+        if len(glossary) >= terms:
+            break
+        glossary[word] = TAG_URL.format(word)
+    while len(glossary) < terms:
+        if rng.random() < 0.5:
+            word = rng.choice(LATIN_WORDS) + str(rng.randint(1, 9999))
+        else:
+            word = ''.join(rng.sample(CJK_WORDS, 2))
+        glossary[word] = TAG_URL.format(word)
+    return glossary
+
+
+def make_document(rng, glossary_terms, targets, size, code_density, link_density):
+    """
+    生成一篇约 size 字节的合成文档
+
+    code_density 为代码块在段落中所占比例，link_density 为每个句子附带一个本地 .md 引用的概率
+    """
+    blocks = [f"# {rng.choice(CJK_WORDS)}{rng.choice(LATIN_WORDS)}\n"]
+    length = len(blocks[0].encode('utf-8'))
+    while length < size:
+        if rng.random() < code_density:
+            lines = [rng.choice(CODE_LINES) for _ in range(rng.randint(3, 12))]
+            block = "```solidity\n" + "\n".join(lines) + "\n```\n"
+        elif rng.random() < 0.1:
+            block = f"## {rng.choice(glossary_terms)} {rng.choice(FILLER)}\n"
+        else:
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                words = [rng.choice(FILLER) for _ in range(rng.randint(4, 12))]
+                for _ in range(rng.randint(0, 2)):
+                    words.insert(rng.randrange(len(words) + 1), f" {rng.choice(glossary_terms)} ")
+                if rng.random() < 0.2:
+                    words.append(f" `{rng.choice(LATIN_WORDS)}` ")
+                if targets and rng.random() < link_density:
+                    words.append(f"（参考 [{rng.choice(CJK_WORDS)}]({rng.choice(targets)})）")
+                sentences.append(''.join(words) + '。')
+            block = ''.join(sentences) + "\n"
+        blocks.append(block + "\n")
+        length += len(block.encode('utf-8')) + 1
+    return ''.join(blocks)
+
+
+def generate_corpus(root, docs=200, terms=500, doc_size=8000, code_density=0.2, link_density=0.05,
+                    seed=0):
+    """
+    在 root 下生成合成语料：root/docs/section-*/N_doc.md 和 root/termlink.md
+
+    Returns:
+        (文档路径列表, termlink.md 路径)
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    glossary = make_glossary(terms, seed)
+    termlink_path = root / "termlink.md"
+    termlink_path.write_text(''.join(f"- [{term}]({url})\n" for term, url in glossary.items()),
+                             encoding='utf-8')
+
+    sections = max(1, docs // 20)
+    paths = [root / "docs" / f"section-{i % sections}" / f"{i}_doc.md" for i in range(docs)]
+    glossary_terms = list(glossary)
+    for path in paths:
+        # 同目录引用和跨目录引用都有
+        targets = [f"./{p.name}" if p.parent == path.parent else f"../{p.parent.name}/{p.name}"
+                   for p in rng.sample(paths, min(len(paths), 10))]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(make_document(rng, glossary_terms, targets, doc_size, code_density, link_density),
+                        encoding='utf-8')
+    return paths, termlink_path
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(items, func, repeat=3):
+    """
+    对 items 中的每一项调用 func 并计时
+
+    items 为 [(字节数, 参数)]。先执行 repeat 轮只计时（取最快一轮计算吞吐，单项耗时取各轮汇总），
+    再单独执行一轮统计内存峰值，避免 tracemalloc 的开销影响计时。
+    """
+    total_bytes = sum(size for size, _ in items)
+    latencies = []
+    best = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        for _, arg in items:
+            item_started = time.perf_counter()
+            func(arg)
+            latencies.append(time.perf_counter() - item_started)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        for _, arg in items:
+            func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'files': len(items),
+        'bytes': total_bytes,
+        'seconds': best,
+        'mb_per_s': total_bytes / 1024 / 1024 / best if best else 0.0,
+        'files_per_s': len(items) / best if best else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+        'latency_p95_ms': percentile(latencies, 0.95) * 1000,
+        'latency_mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def run_suite(paths, termlink_path, base_dir, path_to_url, repeat=3):
+    """对一份语料执行全部基准，返回 {基准名: 结果}"""
+    documents = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        documents.append((len(content.encode('utf-8')), (content, canonical_path(Path(path).resolve(), base_dir))))
+
+    termlink_size = os.path.getsize(termlink_path)
+    terms_dict = extract_terms_and_links(termlink_path)
+    matcher = TermMatcher(terms_dict)
+
+    return {
+        'extract_terms': measure([(termlink_size, termlink_path)], extract_terms_and_links, repeat),
+        'term_matcher': measure([(termlink_size, terms_dict)], TermMatcher, repeat),
+        'add_links': measure(documents,
+                             lambda doc: add_links_to_content(doc[0], terms_dict, matcher), repeat),
+        'update_links': measure(documents,
+                                lambda doc: update_markdown_links(doc[0], path_to_url, doc[1], base_dir),
+                                repeat),
+    }
+
+
+def synthetic_url_map(paths, base_dir, seed=0):
+    """把一半的文档视为已发布，生成 {规范路径: URL}"""
+    rng = random.Random(seed)
+    return {canonical_path(Path(p).resolve(), base_dir): ARTICLE_URL.format(10000 + i)
+            for i, p in enumerate(paths) if rng.random() < 0.5}
+
+
+def bench_synthetic(args):
+    with tempfile.TemporaryDirectory(prefix='bench-md-') as root:
+        root = Path(root).resolve()
+        paths, termlink_path = generate_corpus(root, args.docs, args.terms, args.doc_size,
+                                               args.code_density, args.link_density, args.seed)
+        return run_suite(paths, termlink_path, root, synthetic_url_map(paths, root, args.seed), args.repeat)
+
+
+def bench_real(args):
+    paths = sorted(DOCS_DIR.rglob('*.md'))
+    if not paths:
+        print(f"⚠️  {DOCS_DIR} 下没有文档，跳过真实语料")
+        return None
+
+    with tempfile.TemporaryDirectory(prefix='bench-md-') as root:
+        termlink_path = args.termlink
+        if not os.path.exists(termlink_path):
+            # 没有真实的术语表时使用同样规模的合成术语表
+            termlink_path = Path(root) / "termlink.md"
+            termlink_path.write_text(''.join(f"- [{term}]({url})\n"
+                                             for term, url in make_glossary(args.terms, args.seed).items()),
+                                     encoding='utf-8')
+            print(f"⚠️  未找到 {args.termlink}，真实语料使用 {args.terms} 个合成术语")
+        return run_suite(paths, termlink_path, BASE_DIR, synthetic_url_map(paths, BASE_DIR, args.seed),
+                         args.repeat)
+
+
+def print_results(corpus, results, baseline=None):
+    print(f"\n[{corpus}]")
+    print(f"  {'基准':<14}{'文件':>6}{'MB/s':>10}{'文件/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'峰值 KB':>11}")
+    for name, r in results.items():
+        line = (f"  {name:<14}{r['files']:>6}{r['mb_per_s']:>10.2f}{r['files_per_s']:>11.1f}"
+                f"{r['latency_p50_ms']:>10.3f}{r['latency_p95_ms']:>10.3f}{r['peak_memory_kb']:>11.0f}")
+        old = (baseline or {}).get(name)
+        if old and old.get('files_per_s'):
+            change = (r['files_per_s'] / old['files_per_s'] - 1) * 100
+            line += f"  吞吐 {change:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Markdown 处理热点路径的基准测试')
+    parser.add_argument('--corpus', choices=['synthetic', 'real', 'both'], default='both',
+                        help='使用的语料，默认 both')
+    parser.add_argument('--docs', type=int, default=200, help='合成文档数，默认 200')
+    parser.add_argument('--terms', type=int, default=500, help='合成术语数，默认 500')
+    parser.add_argument('--doc-size', type=int, default=8000, help='每篇合成文档的字节数，默认 8000')
+    parser.add_argument('--code-density', type=float, default=0.2, help='代码块在段落中的比例，默认 0.2')
+    parser.add_argument('--link-density', type=float, default=0.05, help='句子附带本地 .md 引用的概率，默认 0.05')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子生成相同语料，默认 0')
+    parser.add_argument('--repeat', type=int, default=3, help='计时轮数，默认 3')
+    parser.add_argument('--termlink', default=DEFAULT_TERMLINK_PATH, help='真实语料使用的 termlink.md')
+    parser.add_argument('-o', '--output', help='把结果保存为 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比吞吐')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+
+    results = {}
+    if args.corpus in ('synthetic', 'both'):
+        results['synthetic'] = bench_synthetic(args)
+    if args.corpus in ('real', 'both'):
+        real = bench_real(args)
+        if real:
+            results['real'] = real
+
+    for corpus, corpus_results in results.items():
+        print_results(corpus, corpus_results, baseline.get(corpus))
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {key: getattr(args, key) for key in
+                       ('docs', 'terms', 'doc_size', 'code_density', 'link_density', 'seed', 'repeat')},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
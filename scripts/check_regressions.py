@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+优化实现的回归检查
+
+把经过性能优化的实现与原始实现（或标准库）在同一批输入上逐一对比，结果必须完全一致：
+  terms   replace_terms.add_links_to_content（TermMatcher 一次扫描 + 按编辑拼接结果）
+          与原先逐个术语正则查找、从后向前替换的实现（保留在本文件中作为参照）
+  stream  llm_analyze.StreamingJSONParser 按随机分段输入的解析结果与 json.loads 一次解析的结果
+  store   published_store.PublishedStore 随机写入、多实例读取、合并快照后的记录与内存字典
+
+terms 的语料为 docs 目录中的真实文档（原文、去掉术语链接、去掉全部链接三种形式）、
+合成文档以及由易混淆片段拼成的随机短文本；相同的 --seed 生成相同的输入，结果可复现。
+发现不一致时输出前几个差异并返回 1。
+
+用法:
+  python check_regressions.py                        # 运行全部检查
+  python check_regressions.py --only terms stream    # 只运行部分检查
+  python check_regressions.py --seed 3 --iterations 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from bench_markdown import DOCS_DIR, make_document, make_glossary
+from llm_analyze import StreamingJSONParser
+from published_store import PublishedStore
+from replace_terms import (DEFAULT_TERMLINK_PATH, MAX_LINKS_PER_FILE, MAX_LINKS_PER_TERM, TermMatcher,
+                           add_links_to_content, extract_terms_and_links, remove_all_term_links)
+
+CHECKS = ('terms', 'stream', 'store')
+MAX_REPORTED = 3  # 每项检查最多输出的差异数
+
+
+# ---- 参照实现：原先逐个术语正则替换的 add_links_to_content ----
+
+def _ref_in_code_block(text, pos):
+    return text[:pos].count('```') % 2 == 1
+
+
+def _ref_in_inline_code(text, pos):
+    start = text.rfind('`', 0, pos)
+    if start == -1:
+        return False
+    if start >= 2 and text[start-2:start+1] == '```':
+        return False
+    if start >= 1 and text[start-1:start+2] == '```':
+        return False
+    if start <= len(text) - 3 and text[start:start+3] == '```':
+        return False
+
+    end = text.find('`', pos)
+    if end == -1:
+        return False
+    if end >= 2 and text[end-2:end+1] == '```':
+        return False
+    if end >= 1 and text[end-1:end+2] == '```':
+        return False
+    if end <= len(text) - 3 and text[end:end+3] == '```':
+        return False
+    return True
+
+
+def _ref_in_link(text, pos):
+    before = text[:pos]
+    last_bracket_open = before.rfind('[')
+    last_bracket_close = before.rfind(']')
+    if last_bracket_open != -1 and (last_bracket_close == -1 or last_bracket_open > last_bracket_close):
+        return True
+
+    last_paren_open = before.rfind('(')
+    last_paren_close = before.rfind(')')
+    if last_paren_open != -1 and (last_paren_close == -1 or last_paren_open > last_paren_close):
+        if last_paren_open > 0 and text[last_paren_open-1] == ']':
+            return True
+    return False
+
+
+def _ref_in_url(text, pos):
+    before = text[:pos]
+    last_space = max(before.rfind(' '), before.rfind('\n'), before.rfind('\t'))
+    if last_space != -1:
+        word = before[last_space+1:]
+        return word.startswith('http://') or word.startswith('https://')
+    return before.startswith('http://') or before.startswith('https://')
+
+
+def _ref_in_heading(text, pos):
+    line_start = text.rfind('\n', 0, pos) + 1
+    line_end = text.find('\n', pos)
+    if line_end == -1:
+        line_end = len(text)
+    return text[line_start:line_end].lstrip().startswith('#')
+
+
+def reference_add_links(content, term_links):
+    """原先的实现：每个术语单独正则查找，在不断变化的文本上从后向前替换"""
+    if content.count('https://learnblockchain.cn/tags') >= 4:
+        return content
+
+    result = content
+    total_replacements = 0
+    for term, link in term_links.items():
+        link_count = 0
+        replaced_lines = set()
+        markdown_link = f'[{term}]({link})'
+        if re.search(r'[a-zA-Z]', term):
+            pattern = re.compile(r'\b' + re.escape(term) + r'\b')
+        else:
+            pattern = re.compile(re.escape(term))
+
+        for match in reversed(list(pattern.finditer(result))):
+            pos = match.start()
+            line_number = result[:pos].count('\n')
+            if total_replacements >= MAX_LINKS_PER_FILE:
+                break
+            if link_count >= MAX_LINKS_PER_TERM or line_number in replaced_lines:
+                continue
+            if (_ref_in_code_block(result, pos) or _ref_in_inline_code(result, pos) or
+                    _ref_in_link(result, pos) or _ref_in_url(result, pos) or _ref_in_heading(result, pos)):
+                continue
+            result = result[:pos] + markdown_link + result[pos + len(term):]
+            link_count += 1
+            replaced_lines.add(line_number)
+            total_replacements += 1
+
+        if total_replacements >= MAX_LINKS_PER_FILE:
+            break
+    return result
+
+
+# ---- 差异记录 ----
+
+class Mismatches:
+    def __init__(self, name):
+        self.name = name
+        self.cases = 0
+        self.items = []
+
+    def check(self, label, expected, actual):
+        self.cases += 1
+        if expected != actual:
+            self.items.append((label, expected, actual))
+
+    def report(self, elapsed):
+        if not self.items:
+            print(f"✓ {self.name}: {self.cases} 个样本全部一致（{elapsed:.1f} 秒）")
+            return True
+        print(f"✗ {self.name}: {self.cases} 个样本中有 {len(self.items)} 个不一致（{elapsed:.1f} 秒）")
+        for label, expected, actual in self.items[:MAX_REPORTED]:
+            print(f"  - {label}")
+            print(f"    期望: {_excerpt(expected, actual)}")
+            print(f"    实际: {_excerpt(actual, expected)}")
+        return False
+
+
+def _excerpt(value, other, width=80):
+    """字符串只显示第一个差异附近的内容"""
+    if not isinstance(value, str) or not isinstance(other, str):
+        return repr(value)[:width * 2]
+    pos = next((i for i, (a, b) in enumerate(zip(value, other)) if a != b), min(len(value), len(other)))
+    start = max(0, pos - width // 2)
+    return f"（第 {pos} 个字符附近）{value[start:start + width]!r}"
+
+
+# ---- terms ----
+
+def docs_glossary(texts, rng, termlink_path):
+    """术语表：优先使用真实的 termlink.md，否则由文档中的链接文字、英文单词和中文片段组成"""
+    if termlink_path and os.path.exists(termlink_path):
+        return extract_terms_and_links(termlink_path)
+
+    joined = ''.join(texts)
+    terms = dict(re.findall(r'\[([^\]\n]{1,15})\]\((https?://[^)\s]+)\)', joined))
+    latin = sorted(set(re.findall(r'[A-Za-z][A-Za-z0-9_.]{1,12}', joined)))
+    cjk = sorted({word[:n] for word in re.findall(r'[一-鿿]{2,6}', joined) for n in (2, 3, 4)
+                  if len(word) >= n})
+    for word in rng.sample(latin, min(300, len(latin))):
+        terms.setdefault(word, f'https://learnblockchain.cn/tags/{word}?map=EVM')
+    for word in rng.sample(cjk, min(300, len(cjk))):
+        terms.setdefault(word, f'https://example.com/{word}')
+    # 含特殊字符、互为前后缀的术语
+    terms.update({'C++': 'https://example.com/cpp', '.NET': 'https://example.com/net',
+                  'a': 'https://example.com/a', 'aa': 'https://example.com/aa'})
+    items = list(terms.items())
+    rng.shuffle(items)
+    return dict(items)
+
+
+FRAGMENTS = ['a', 'aa', 'b', 'Gas', '以太坊', '太坊', '代币', 'ERC20', 'C++', ' ', '\n', '\t', '`', '```',
+             '[', ']', '(', ')', '#', 'http://', 'https://', '_', '.', '，']
+FRAGMENT_TERMS = {'a': 'https://x/a', 'aa': 'https://x/aa', 'b': 'https://x/b', 'Gas': 'https://x/gas',
+                  '以太坊': 'https://x/eth', '太坊': 'https://x/tf', '代币': 'https://x/token',
+                  'ERC20': 'https://x/erc20', 'C++': 'https://x/cpp'}
+
+
+def check_terms(args, rng):
+    result = Mismatches('terms（add_links_to_content 与逐个术语正则替换）')
+
+    docs = {str(p): p.read_text(encoding='utf-8') for p in sorted(Path(args.docs_dir).rglob('*.md'))}
+    if not docs:
+        print(f"⚠️  {args.docs_dir} 下没有文档，只检查合成语料")
+    glossary = docs_glossary(docs.values(), rng, args.termlink)
+    matcher = TermMatcher(glossary)
+    for path, text in docs.items():
+        variants = (('原文', text),
+                    ('去掉术语链接', remove_all_term_links(text, glossary)),
+                    ('去掉全部链接', re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)))
+        for kind, variant in variants:
+            result.check(f"{path}（{kind}）", reference_add_links(variant, glossary),
+                         add_links_to_content(variant, glossary, matcher))
+
+    synthetic = make_glossary(300, args.seed)
+    synthetic_matcher = TermMatcher(synthetic)
+    terms = list(synthetic)
+    for i in range(args.synthetic_docs):
+        text = make_document(rng, terms, [], rng.randint(500, 6000), code_density=0.3, link_density=0)
+        # 已有部分术语链接的文档
+        if i % 2:
+            text = add_links_to_content(text, dict(rng.sample(list(synthetic.items()), 20)))
+        result.check(f"合成文档 {i}", reference_add_links(text, synthetic),
+                     add_links_to_content(text, synthetic, synthetic_matcher))
+
+    items = list(FRAGMENT_TERMS.items())
+    for i in range(args.iterations):
+        rng.shuffle(items)
+        terms = dict(items[:rng.randint(1, len(items))])
+        text = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 400)))
+        result.check(f"随机文本 {i}: {text[:60]!r}… 术语 {list(terms)}", reference_add_links(text, terms),
+                     add_links_to_content(text, terms))
+    return result
+
+
+# ---- stream ----
+
+STRING_CHARS = 'abc 中文"\\/{}[],:\n\t\u2028😀'
+
+
+def random_json(rng, depth=0):
+    kind = rng.choice(['str', 'int', 'float', 'bool', 'null'] + (['list', 'dict'] if depth < 3 else []))
+    if kind == 'str':
+        return ''.join(rng.choice(STRING_CHARS) for _ in range(rng.randint(0, 12)))
+    if kind == 'int':
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 'float':
+        return rng.uniform(-1e6, 1e6)
+    if kind == 'bool':
+        return rng.random() < 0.5
+    if kind == 'null':
+        return None
+    if kind == 'list':
+        return [random_json(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {random_json_key(rng): random_json(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+def random_json_key(rng):
+    return rng.choice(['title', 'summary', 'keywords', '标题', 'a"b', 'c\\d', '']) + str(rng.randint(0, 3))
+
+
+def check_stream(args, rng):
+    result = Mismatches('stream（StreamingJSONParser 与 json.loads）')
+    prefixes = ['', '```json\n', '好的，分析结果如下：\n', ' \n']
+    for i in range(args.iterations):
+        obj = {random_json_key(rng): random_json(rng) for _ in range(rng.randint(0, 6))}
+        body = json.dumps(obj, ensure_ascii=rng.random() < 0.5,
+                          indent=rng.choice([None, 2, 4]),
+                          separators=rng.choice([None, (',', ':'), (' , ', ' : ')]))
+        text = rng.choice(prefixes) + body + rng.choice(['', '\n```', '\n'])
+
+        parser = StreamingJSONParser()
+        pos = 0
+        try:
+            while pos < len(text):
+                size = rng.randint(1, 16)
+                parser.feed(text[pos:pos + size])
+                pos += size
+            actual = (parser.complete, parser.fields)
+        except ValueError as e:
+            actual = f"解析出错: {e}"
+        result.check(f"对象 {i}: {body[:80]!r}", (True, json.loads(body)), actual)
+    return result
+
+
+# ---- store ----
+
+def check_store(args, rng):
+    result = Mismatches('store（PublishedStore 与内存字典）')
+    keys = [f"docs/{i}_文章.md" for i in range(20)]
+    with tempfile.TemporaryDirectory(prefix='check-store-') as workdir:
+        path = Path(workdir) / "published_articles.json"
+        expected = {}
+        # 两个实例模拟两个同时发布的进程
+        stores = [PublishedStore(path), PublishedStore(path)]
+        for i in range(args.iterations):
+            store = rng.choice(stores)
+            key = rng.choice(keys)
+            op = rng.random()
+            if op < 0.5:
+                info = {'lbc_article_id': rng.randint(1, 10 ** 6), 'published_at': f"2026-01-{i % 28 + 1:02d}"}
+                store.put(key, info)
+                expected[key] = info
+            elif op < 0.7:
+                updated = store.update(key, content_sha256=f"{i:064x}")
+                result.check(f"第 {i} 步 update({key}) 的返回值", key in expected, updated)
+                if key in expected:
+                    expected[key] = dict(expected[key], content_sha256=f"{i:064x}")
+            elif op < 0.85:
+                store.remove(key)
+                expected.pop(key, None)
+            elif op < 0.9:
+                store.compact()
+            elif op < 0.95:
+                # 重新打开：模拟新启动的进程读取快照和日志
+                stores[rng.randrange(len(stores))] = PublishedStore(path)
+
+            reader = rng.choice(stores)
+            result.check(f"第 {i} 步 get({key})", expected.get(key), reader.get(key))
+            result.check(f"第 {i} 步 contains({key})", key in expected, reader.contains(key))
+            if i % 50 == 0:
+                result.check(f"第 {i} 步 all()", expected, reader.all())
+
+        stores[0].compact()
+        with open(path, 'r', encoding='utf-8') as f:
+            result.check("合并后的快照文件", expected, json.load(f))
+        result.check("重新打开后的全部记录", expected, PublishedStore(path).all())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比优化后的实现与原始实现，检查结果是否一致')
+    parser.add_argument('--only', nargs='+', choices=CHECKS, help='只运行指定的检查，默认全部')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，默认 0')
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='随机文本、随机 JSON 和存储操作的样本数，默认 2000')
+    parser.add_argument('--synthetic-docs', type=int, default=50, help='terms 检查的合成文档数，默认 50')
+    parser.add_argument('--docs-dir', default=str(DOCS_DIR), help=f'真实文档目录，默认 {DOCS_DIR}')
+    parser.add_argument('--termlink', default=DEFAULT_TERMLINK_PATH,
+                        help='真实的 termlink.md，不存在时由文档内容生成术语表')
+    args = parser.parse_args()
+
+    functions = {'terms': check_terms, 'stream': check_stream, 'store': check_store}
+    ok = True
+    for name in args.only or CHECKS:
+        started = time.monotonic()
+        result = functions[name](args, random.Random(args.seed))
+        ok = result.report(time.monotonic() - started) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    exit(main())
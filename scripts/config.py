@@ -13,8 +13,28 @@ LLM_MODEL_GPT_4O_MINI = "gpt-4o-mini-2024-07-18"
 
 MAX_TOKENS = 8000  
 
+# 长文章分块总结：每块的估算 token 数上限及并发总结的块数
+ANALYZE_CHUNK_TOKENS = 3000
+ANALYZE_CHUNK_WORKERS = 4
+
+# LLM 客户端 HTTP 连接池配置，同一 (base_url, api_key) 的请求共用连接
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+
 # LBC (LearnBlockchain.cn) API 配置
 LBC_BASE_API_URL = os.getenv("LBC_BASE_API_URL", "")
 LBC_API_KEY = os.getenv("LBC_API_KEY", "")
+# LBC API 连接池大小及单次请求超时（秒）
+LBC_HTTP_POOL_SIZE = int(os.getenv("LBC_HTTP_POOL_SIZE", "8"))
+LBC_HTTP_TIMEOUT = float(os.getenv("LBC_HTTP_TIMEOUT", "60"))
+# 发布（创建）文章请求的读取超时（秒），0 表示不限：服务端处理长文章可能较慢，超时后结果未知
+LBC_CREATE_READ_TIMEOUT = float(os.getenv("LBC_CREATE_READ_TIMEOUT", "0"))
+# LBC API 连续失败多少次后熔断，以及熔断后暂停请求的秒数
+LBC_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LBC_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LBC_CIRCUIT_RESET_TIMEOUT = float(os.getenv("LBC_CIRCUIT_RESET_TIMEOUT", "30"))
+
 
 
+# 图片 CDN（又拍云）地址，以此开头的图片无需迁移
+IMAGE_CDN_PREFIX = "https://img.learnblockchain.cn/"
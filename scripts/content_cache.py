@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容哈希跳过缓存
+
+按文件路径记录文件内容的哈希以及处理时所用映射（术语字典、已发布文章 URL 映射等）
+的哈希。再次运行时，文件内容和映射都没有变化的文件可以直接跳过，无需重新解析。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+# 缓存清单默认存放目录
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+
+def content_hash(data):
+    """计算内容的 SHA-256，data 可以是 str 或 bytes"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def mapping_hash(mapping, *extra):
+    """计算映射（及影响处理结果的其他参数）的哈希，映射的顺序也会影响结果"""
+    payload = json.dumps([mapping, list(extra)], ensure_ascii=False, default=str)
+    return content_hash(payload)
+
+
+class ContentHashCache:
+    """持久化的内容哈希清单
+
+    清单结构: {文件绝对路径: {"content": 内容哈希, "mapping": 映射哈希, "size": 字节数, "mtime_ns": 修改时间}}
+    文件大小和修改时间都未变化时直接认为内容未变，否则重新计算内容哈希进行比较。
+    """
+
+    def __init__(self, manifest_path, mapping_digest):
+        self.manifest_path = Path(manifest_path)
+        self.mapping_digest = mapping_digest
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"读取缓存清单 {self.manifest_path} 时出错，将忽略缓存: {e}")
+            return {}
+
+    @staticmethod
+    def _key(file_path):
+        return str(Path(file_path).resolve())
+
+    def is_fresh(self, file_path):
+        """检查文件是否在当前映射下已经处理过且内容未变化"""
+        key = self._key(file_path)
+        entry = self._entries.get(key)
+        if not entry or entry.get('mapping') != self.mapping_digest:
+            self.misses += 1
+            return False
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            self.misses += 1
+            return False
+
+        if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            self.hits += 1
+            return True
+
+        # 修改时间变化（如 git checkout）但内容可能相同，比较内容哈希
+        with open(file_path, 'rb') as f:
+            digest = content_hash(f.read())
+        if digest == entry.get('content'):
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._dirty = True
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def record(self, file_path):
+        """记录文件当前内容在当前映射下已是最新结果"""
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            digest = content_hash(f.read())
+        self._entries[self._key(file_path)] = {
+            'content': digest,
+            'mapping': self.mapping_digest,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        self._dirty = True
+
+    def forget(self, file_path):
+        """移除文件的缓存记录"""
+        if self._entries.pop(self._key(file_path), None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """原子地写回缓存清单"""
+        if not self._dirty:
+            return
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.manifest_path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._dirty = False
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片压缩与格式转换
+
+在上传到又拍云之前压缩图片：PNG 无损重新编码（像素不变）；JPEG 重新编码是有损的，
+只有指定 --jpeg-quality 时才处理，默认原样保留。
+可选地把宽度超过上限的图片等比缩小（有损）；命令行还可以生成 WebP / AVIF 版本用于评估体积，
+上传流程（upyun_upload / migrate_images）只上传主文件，不生成这些版本。
+APNG 等多帧图片、GIF 动图、SVG 和视频原样上传。
+结果按 输入内容哈希 + 参数 缓存在 scripts/.cache/images 下，内容未变的图片不会重复处理。
+
+依赖 Pillow（pip install Pillow），未安装时该步骤自动跳过。
+
+用法:
+  python image_optimize.py ../static/img                 # 统计可节省的体积
+  python image_optimize.py ../docs --in-place            # 用无损压缩结果替换本地图片
+  python image_optimize.py ../docs --jpeg-quality 85     # JPEG 按质量 85 有损重新编码
+  python image_optimize.py ../static/img --max-width 1600 --webp -j 4
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from content_cache import CACHE_DIR, content_hash, mapping_hash
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow 为可选依赖
+    Image = None
+    features = None
+
+IMAGE_CACHE_DIR = CACHE_DIR / "images"
+
+# 处理逻辑变化时递增，使旧的缓存结果失效
+OPTIMIZE_VERSION = 2
+
+# 可以处理的格式（按 Pillow 的格式名），GIF 动图、SVG 和视频原样上传
+OPTIMIZABLE_FORMATS = {'PNG': '.png', 'JPEG': '.jpg'}
+
+
+def is_available():
+    return Image is not None
+
+
+def make_options(max_width=None, webp=False, avif=False, jpeg_quality=None):
+    """压缩参数：max_width 为最大宽度（None 表示不缩放），webp/avif 表示是否生成对应格式，
+    jpeg_quality 为 JPEG 有损重新编码的质量（None 表示不重新编码 JPEG）"""
+    if avif and not (is_available() and features.check('avif')):
+        print("⚠️  当前 Pillow 不支持 AVIF，跳过 AVIF 转换")
+        avif = False
+    return {'max_width': max_width, 'webp': bool(webp), 'avif': bool(avif), 'jpeg_quality': jpeg_quality}
+
+
+def _save(img, path, fmt, **params):
+    with open(path, 'wb') as f:
+        img.save(f, fmt, **params)
+    return os.path.getsize(path)
+
+
+def _encode(img, src_format, out_path, jpeg_quality=None):
+    """重新编码为原格式：PNG 像素不变；JPEG 会解码后重新压缩，是有损的"""
+    params = {key: img.info[key] for key in ('exif', 'icc_profile') if img.info.get(key)}
+    if src_format == 'PNG':
+        return _save(img, out_path, 'PNG', optimize=True, **params)
+    params.update(optimize=True, progressive=True, quality=jpeg_quality or 95)
+    return _save(img, out_path, 'JPEG', **params)
+
+
+def optimize_file(src_path, options):
+    """
+    压缩单个图片，结果写入缓存目录
+
+    Returns:
+        dict: {'source', 'path', 'ext', 'original', 'optimized', 'variants', 'cached', 'lossless'}
+        path 为用于上传的文件（未能压缩得更小时为原文件），variants 为 {扩展名: (路径, 大小)}，
+        lossless 表示 path 与原图像素是否一致
+    """
+    src_path = Path(src_path)
+    with open(src_path, 'rb') as f:
+        data = f.read()
+    original = len(data)
+    key = content_hash(data)[:32] + '-' + mapping_hash(options, OPTIMIZE_VERSION)[:8]
+    result = {'source': str(src_path), 'path': str(src_path), 'ext': src_path.suffix.lower(),
+              'original': original, 'optimized': original, 'variants': {}, 'cached': False,
+              'lossless': True}
+    if not is_available():
+        return result
+
+    # 缓存命中：主文件或“无法压缩”的标记已存在
+    cached = sorted(IMAGE_CACHE_DIR.glob(key + '.*'))
+    if cached:
+        result['cached'] = True
+        for path in cached:
+            ext = path.suffix
+            if ext in ('.skip', '.lossy'):
+                continue
+            if ext in ('.webp', '.avif'):
+                result['variants'][ext] = (str(path), path.stat().st_size)
+            else:
+                result.update(path=str(path), ext=ext, optimized=path.stat().st_size,
+                              lossless=not (IMAGE_CACHE_DIR / (key + '.lossy')).exists())
+        return result
+
+    try:
+        img = Image.open(src_path)
+        img.load()
+    except Exception:
+        _mark_skipped(key)
+        return result
+
+    src_format = img.format
+    if src_format not in OPTIMIZABLE_FORMATS or getattr(img, 'n_frames', 1) > 1:
+        # 多帧图片（APNG）重新编码只会保留第一帧，与 GIF 动图一样原样上传
+        _mark_skipped(key)
+        return result
+
+    IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    ext = OPTIMIZABLE_FORMATS[src_format]
+
+    max_width = options.get('max_width')
+    resized = bool(max_width and img.width > max_width)
+    reencode = src_format == 'PNG' or resized or options.get('jpeg_quality')
+    if resized:
+        height = max(1, round(img.height * max_width / img.width))
+        small = img.resize((max_width, height), Image.LANCZOS)
+        small.info = img.info
+        img = small
+
+    # 先写入临时文件，完成后再改名，避免其他进程读到写了一半的缓存
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        size = _encode(img, src_format, tmp_path, options.get('jpeg_quality')) if reencode else original
+        if reencode and (size < original or resized):
+            out_path = IMAGE_CACHE_DIR / (key + ext)
+            lossless = src_format == 'PNG' and not resized
+            if not lossless:
+                # 先记录结果是有损的，再放入主文件，供缓存命中时判断
+                (IMAGE_CACHE_DIR / (key + '.lossy')).touch()
+            os.replace(tmp_path, out_path)
+            result.update(path=str(out_path), ext=ext, optimized=size, lossless=lossless)
+        else:
+            _mark_skipped(key)
+
+        for variant, enabled, params in (
+                ('.webp', options.get('webp'), {'lossless': src_format == 'PNG', 'quality': 90, 'method': 6}),
+                ('.avif', options.get('avif'), {'quality': 75})):
+            if not enabled:
+                continue
+            out_path = IMAGE_CACHE_DIR / (key + variant)
+            _save(img, tmp_path, variant[1:].upper(), **params)
+            os.replace(tmp_path, out_path)
+            result['variants'][variant] = (str(out_path), out_path.stat().st_size)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    return result
+
+
+def _mark_skipped(key):
+    """记录该图片在当前参数下无需处理"""
+    IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    (IMAGE_CACHE_DIR / (key + '.skip')).touch()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(jobs=None):
+    """获取进程内共用的压缩进程池，上传线程把压缩任务提交到这里"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+        return _pool
+
+
+def start_pool(jobs=None):
+    """
+    在启动上传线程之前调用：创建进程池并让工作进程立即启动
+
+    进程池在第一次提交任务时才 fork 工作进程，若在上传线程中才创建，
+    子进程会继承其他线程持有的锁（如日志、连接池），可能死锁
+    """
+    pool = get_pool(jobs)
+    pool.submit(os.getpid).result()
+    return pool
+
+
+def optimize_in_pool(src_path, options):
+    """在共用进程池中压缩图片，出错时返回未压缩的结果"""
+    try:
+        return get_pool().submit(optimize_file, str(src_path), options).result()
+    except Exception as e:
+        print(f"⚠️  压缩图片 {src_path} 失败: {e}，使用原图")
+        size = os.path.getsize(src_path)
+        return {'source': str(src_path), 'path': str(src_path), 'ext': Path(src_path).suffix.lower(),
+                'original': size, 'optimized': size, 'variants': {}, 'cached': False, 'lossless': True}
+
+
+def optimize_files(paths, options, jobs=None):
+    """用进程池批量压缩图片，返回结果列表"""
+    results = []
+    if not paths:
+        return results
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = {executor.submit(optimize_file, str(p), options): p for p in paths}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"⚠️  压缩图片 {futures[future]} 失败: {e}")
+    return results
+
+
+def summarize(results):
+    """汇总体积变化"""
+    original = sum(r['original'] for r in results)
+    optimized = sum(r['optimized'] for r in results)
+    return {
+        'images': len(results),
+        'optimized_images': sum(1 for r in results if r['optimized'] < r['original']),
+        'cached': sum(1 for r in results if r['cached']),
+        'original_bytes': original,
+        'optimized_bytes': optimized,
+        'saved_bytes': original - optimized,
+        'variant_bytes': {ext: sum(r['variants'][ext][1] for r in results if ext in r['variants'])
+                          for ext in ('.webp', '.avif')},
+    }
+
+
+def format_summary(summary):
+    saved = summary['saved_bytes']
+    percent = saved * 100 / summary['original_bytes'] if summary['original_bytes'] else 0
+    text = (f"图片压缩: {summary['optimized_images']}/{summary['images']} 张变小（缓存命中 {summary['cached']}），"
+            f"{summary['original_bytes'] / 1024:.0f}KB -> {summary['optimized_bytes'] / 1024:.0f}KB，"
+            f"节省 {saved / 1024:.0f}KB ({percent:.1f}%)")
+    for ext, size in summary['variant_bytes'].items():
+        if size:
+            text += f"，{ext[1:].upper()} 版本共 {size / 1024:.0f}KB"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='压缩图片并可选生成 WebP / AVIF 版本')
+    parser.add_argument('paths', nargs='+', help='图片文件或目录')
+    parser.add_argument('--max-width', type=int, help='宽度超过该值的图片等比缩小')
+    parser.add_argument('--webp', action='store_true', help='生成 WebP 版本')
+    parser.add_argument('--avif', action='store_true', help='生成 AVIF 版本')
+    parser.add_argument('-j', '--jobs', type=int, help='并行进程数，默认 CPU 核数')
+    parser.add_argument('--jpeg-quality', type=int, metavar='Q',
+                        help='JPEG 按该质量有损重新编码（1-95），默认不处理 JPEG')
+    parser.add_argument('--in-place', action='store_true',
+                        help='用压缩后的文件替换原图（只替换无损且变小的图片，加 --allow-lossy 时也替换有损结果）')
+    parser.add_argument('--allow-lossy', action='store_true', help='--in-place 时允许用有损结果替换原图')
+    args = parser.parse_args()
+
+    if not is_available():
+        print("✗ 未安装 Pillow，请先执行 pip install Pillow")
+        return 1
+
+    files = []
+    for path in map(Path, args.paths):
+        candidates = path.rglob('*') if path.is_dir() else [path]
+        files.extend(p for p in candidates
+                     if p.is_file() and p.suffix.lower() in ('.png', '.jpg', '.jpeg'))
+
+    options = make_options(args.max_width, args.webp, args.avif, args.jpeg_quality)
+    results = optimize_files(sorted(set(files)), options, args.jobs)
+
+    if args.in_place:
+        for result in results:
+            if result['optimized'] >= result['original'] or result['path'] == result['source']:
+                continue
+            if not result['lossless'] and not args.allow_lossy:
+                print(f"  跳过 {result['source']}: 压缩结果是有损的，需要 --allow-lossy")
+                continue
+            shutil.copyfile(result['path'], result['source'])
+            print(f"  已替换 {result['source']}: {result['original']} -> {result['optimized']} 字节")
+
+    print(format_summary(summarize(results)))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
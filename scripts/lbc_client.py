@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LBC (LearnBlockchain.cn) API 客户端
+
+发布和更新文章共用的 HTTP 客户端：
+- 基于 requests.Session 的长连接池，多线程请求复用连接
+- 遇到 429 / 5xx / 网络错误时按带抖动的指数退避重试，优先遵循 Retry-After；
+  非幂等请求（如发布文章）应带上幂等键（Idempotency-Key 请求头），服务端据此识别重复提交，
+  没有幂等键的非幂等请求只在连接未建立或服务端明确要求稍后重试（429 / Retry-After）时重试
+- 熔断器：连续失败过多时暂停请求一段时间，避免在服务不可用时继续压垮它
+- 记录请求次数、尝试次数、状态码和延迟，便于评估吞吐
+
+离线压测可配合 lbc_stub_server.py 使用。
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+from config import (LBC_BASE_API_URL, LBC_API_KEY, LBC_HTTP_POOL_SIZE, LBC_HTTP_TIMEOUT,
+                    LBC_CIRCUIT_FAILURE_THRESHOLD, LBC_CIRCUIT_RESET_TIMEOUT)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_RETRY_DELAY = 60  # 单次重试等待的上限（秒），Retry-After 也不超过它
+
+
+class CircuitBreaker:
+    """熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒后放行一个试探请求"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=LBC_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=LBC_CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """当前是否允许发出请求"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                # 半开状态只放行一个试探请求
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold > 0:
+                if self.state != self.OPEN:
+                    print(f"⚠️  LBC API 连续失败 {self._failures} 次，暂停请求 {self.reset_timeout} 秒")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class ClientMetrics:
+    """请求统计：次数、尝试次数、状态码分布、重试等待时间和单次请求延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.retry_wait = 0.0
+        self.status_codes = {}
+        self.latencies = []
+
+    def record_attempt(self, status, latency):
+        with self._lock:
+            self.attempts += 1
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            self.latencies.append(latency)
+
+    def record_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.retry_wait += delay
+
+    def record_request(self, ok):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.failures += 1
+
+    def record_rejected(self):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+            return {
+                'requests': self.requests,
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'retry_wait': self.retry_wait,
+                'status_codes': dict(self.status_codes),
+                'latency_p50': percentile(0.5),
+                'latency_p95': percentile(0.95),
+                'latency_max': latencies[-1] if latencies else 0.0,
+            }
+
+
+def is_connect_error(exc):
+    """请求是否在建立连接阶段就失败了（请求尚未发出，重试不会导致重复提交）"""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.ConnectionError):
+        return False
+    reason = exc.args[0] if exc.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回等待秒数，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class LBCClient:
+    """LBC API 客户端，可在多个线程间共用"""
+
+    def __init__(self, base_url=None, api_key=None, pool_size=LBC_HTTP_POOL_SIZE,
+                 timeout=LBC_HTTP_TIMEOUT, breaker=None):
+        self.base_url = LBC_BASE_API_URL if base_url is None else base_url
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = ClientMetrics()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'x-api-key': LBC_API_KEY if api_key is None else api_key
+        })
+
+    def backoff_delay(self, attempt, retry_delay, response=None):
+        """第 attempt 次失败后的等待时间：优先使用 Retry-After，否则为带抖动的指数退避"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, MAX_RETRY_DELAY)
+        delay = min(retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def can_retry_unsafe(response, exc):
+        """非幂等请求失败后能否安全重试：连接未建立，或服务端以 429 / Retry-After 表示请求未被处理"""
+        if response is None:
+            return is_connect_error(exc)
+        return response.status_code == 429 or response.headers.get('Retry-After') is not None
+
+    def post(self, path, payload, label=None, max_retries=3, retry_delay=2, timeout=None, idempotent=True,
+             idempotency_key=None):
+        """
+        发送表单 POST 请求，遇到 429 / 5xx / 网络错误时重试
+
+        Args:
+            path: API 路径，如 '/api/post/article'
+            payload: 表单数据
+            label: 日志中标识本次请求的文字
+            max_retries: 最多尝试次数
+            retry_delay: 首次重试的基准等待时间（秒），之后每次翻倍
+            timeout: 单次请求超时（秒），也可以是 (连接超时, 读取超时)，读取超时为 None 表示不限；
+                默认使用客户端的 timeout
+            idempotent: 请求重复提交是否无害；为 False 且没有 idempotency_key 时只在 can_retry_unsafe 时重试，
+                读超时、连接中断和普通 5xx 可能已被服务端处理，直接返回错误
+            idempotency_key: 幂等键，每次尝试都以 Idempotency-Key 请求头发送同一个值，
+                服务端据此把重试当作同一次提交，因此可以和幂等请求一样重试
+
+        Returns:
+            (response, attempts, error): 请求失败时 error 为错误信息，response 为最后一次响应（可能为 None）
+        """
+        label = label or path
+        timeout = self.timeout if timeout is None else timeout
+        data = urlencode(payload)
+        headers = {IDEMPOTENCY_HEADER: idempotency_key} if idempotency_key else None
+        safe_to_retry = idempotent or bool(idempotency_key)
+
+        response = None
+        error = None
+        exc = None
+        attempt = 0
+        while attempt < max_retries:
+            if not self.breaker.allow():
+                error = "熔断中，LBC API 暂停请求"
+                if attempt == 0:
+                    self.metrics.record_rejected()
+                    print(f" {label} 未发送，{error}")
+                    return None, 0, error
+                break
+
+            attempt += 1
+            metrics.incr('lbc_bytes_sent', len(data))
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.base_url + path, data=data, headers=headers, timeout=timeout)
+                error = None
+                exc = None
+                status = response.status_code
+            except requests.RequestException as e:
+                response = None
+                error = f"网络错误: {e}"
+                exc = e
+                status = 'error'
+            self.metrics.record_attempt(status, time.monotonic() - started)
+
+            if error is None and status not in RETRY_STATUS_CODES:
+                self.breaker.record_success()
+                self.metrics.record_request(ok=True)
+                return response, attempt, None
+
+            if error is None:
+                error = f"HTTP {status}"
+            self.breaker.record_failure()
+
+            if not safe_to_retry and not self.can_retry_unsafe(response, exc):
+                print(f" {label} 遇到{error}，请求可能已被处理，为避免重复提交不再重试")
+                break
+
+            if attempt < max_retries:
+                delay = self.backoff_delay(attempt, retry_delay, response)
+                print(f" {label} 遇到{error}，{delay:.1f}秒后重试 (第 {attempt}/{max_retries} 次尝试)")
+                self.metrics.record_retry(delay)
+                metrics.observe('retry_wait', delay, path=path)
+                time.sleep(delay)
+
+        print(f" {label} 请求失败，{error}，已尝试 {attempt} 次，放弃")
+        self.metrics.record_request(ok=False)
+        return response, attempt, error
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """获取进程内共用的 LBC API 客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LBCClient()
+        return _client
+
+
+def format_metrics(metrics):
+    """把 ClientMetrics.snapshot() 的结果格式化为一行文字"""
+    return (f"请求 {metrics['requests']} 次（失败 {metrics['failures']}，熔断拒绝 {metrics['rejected']}），"
+            f"尝试 {metrics['attempts']} 次，重试 {metrics['retries']} 次共等待 {metrics['retry_wait']:.1f} 秒，"
+            f"延迟 p50 {metrics['latency_p50'] * 1000:.0f}ms / p95 {metrics['latency_p95'] * 1000:.0f}ms")
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 LBC API / LLM API 模拟服务
+
+实现以下接口，可模拟响应延迟、5xx 错误、504 网关超时和 429 限流，
+用于在不访问线上服务的情况下测试发布/更新脚本和压测客户端。
+发布文章接口模拟的 504 为"服务端已创建文章、网关超时"，并按 Idempotency-Key 请求头识别重复提交：
+
+  /api/post/article、/api/article/update   LBC 文章接口
+  .../chat/completions                      OpenAI 兼容的对话接口（包括 stream=True 的 SSE 流式返回）
+
+录制与回放：
+  --record 模式下把请求转发到 --lbc-upstream / --llm-upstream 指定的真实服务，
+  并把响应按请求内容写入 --cassette 文件；默认的回放模式下，请求内容与录制时相同的请求
+  按录制的响应返回，没有录制的请求返回模拟结果。
+
+用法:
+  # 启动模拟服务，然后把 LBC_BASE_API_URL / OPENROUTER_BASE_URL 指向它运行其他脚本
+  python lbc_stub_server.py --port 8900 --latency 0.2 --error-rate 0.1
+  LBC_BASE_API_URL=http://127.0.0.1:8900 python update_articles.py --all --force
+
+  # 录制真实的 LLM 响应，之后用录制结果回放
+  python lbc_stub_server.py --record --llm-upstream https://openrouter.ai/api/v1 --cassette llm.jsonl
+  python lbc_stub_server.py --cassette llm.jsonl
+
+  # 压测：启动模拟服务并用 LBC 客户端并发请求
+  python lbc_stub_server.py --bench 200 --workers 8 --latency 0.05 --throttle-rate 0.05
+
+端到端的批量发布压测见 replay_harness.py。
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from content_cache import content_hash
+
+LLM_PATH = '/chat/completions'
+
+# 录制时保留的响应头
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+
+# 模拟分析结果时从文章中挑选的关键词
+STUB_KEYWORDS = ['Solidity', '以太坊', '智能合约', 'EVM', 'Gas', 'ERC20', 'ERC721', '代币', '钱包', 'Foundry']
+
+
+def request_key(path, body, content_type=''):
+    """根据接口和请求内容计算录制键，JSON 和表单请求与字段顺序无关"""
+    if path.endswith(LLM_PATH):
+        path = LLM_PATH  # 不同服务商的 base_url 前缀不同，统一按接口匹配
+    text = body.decode('utf-8', errors='replace')
+    if 'json' in content_type:
+        try:
+            text = json.dumps(json.loads(text), sort_keys=True, ensure_ascii=False)
+        except ValueError:
+            pass
+    elif 'x-www-form-urlencoded' in content_type:
+        text = json.dumps(sorted(parse_qsl(text, keep_blank_values=True)), ensure_ascii=False)
+    return content_hash(path + '\n' + text)
+
+
+class Cassette:
+    """录制文件（JSON Lines）：每行一个 {key, path, status, headers, body, stream}
+
+    同一请求录制了多次时（例如先 429 后成功），回放时按录制顺序依次返回，之后重复最后一次。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._replayed = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['key'], []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def get(self, key):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.setdefault(entry['key'], []).append(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+class LBCStubServer(ThreadingHTTPServer):
+    """模拟 LBC API 和 LLM API 的 HTTP 服务，延迟和故障比例可在运行时修改"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 timeout_rate=0.0, timeout_delay=1.0, llm_latency=1.0, cassette=None, record=False,
+                 lbc_upstream=None, llm_upstream=None):
+        super().__init__(address, LBCStubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.llm_latency = llm_latency
+        self.cassette = Cassette(cassette) if cassette else None
+        self.record = record
+        self.upstreams = {'lbc': lbc_upstream, 'llm': llm_upstream}
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0, 'timeouts': 0, 'connections': 0,
+                      'llm_requests': 0, 'streams': 0, 'recorded': 0, 'replayed': 0, 'synthesized': 0,
+                      'articles': 0, 'deduplicated': 0}
+        self._next_article_id = 10000
+        self._articles = {}  # 幂等键 -> 文章 ID
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def next_article_id(self):
+        with self._lock:
+            self._next_article_id += 1
+            return self._next_article_id
+
+    def create_article(self, idempotency_key=None):
+        """创建文章并返回文章 ID，幂等键相同的重复提交返回已创建的文章"""
+        with self._lock:
+            if idempotency_key and idempotency_key in self._articles:
+                self.stats['deduplicated'] += 1
+                return self._articles[idempotency_key]
+            self._next_article_id += 1
+            self.stats['articles'] += 1
+            if idempotency_key:
+                self._articles[idempotency_key] = self._next_article_id
+            return self._next_article_id
+
+
+class LBCStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持长连接，便于观察连接复用
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写出，避免 Nagle 算法带来的额外延迟
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        is_llm = self.path.endswith(LLM_PATH)
+        server.count('requests')
+        if is_llm:
+            server.count('llm_requests')
+
+        if server.record:
+            return self._proxy(body, is_llm)
+
+        # LLM 接口的延迟在生成响应时体现（流式返回时分摊到各个分片）
+        if server.latency and not is_llm:
+            time.sleep(random.uniform(server.latency / 2, server.latency * 1.5))
+
+        roll = random.random()
+        if roll < server.throttle_rate:
+            server.count('throttled')
+            return self._send(429, {'code': 429, 'message': 'Too Many Requests'},
+                              {'Retry-After': str(server.retry_after)})
+        roll -= server.throttle_rate
+        if roll < server.timeout_rate:
+            # 网关超时：请求挂起一段时间后返回 504，发布文章的请求在服务端已经处理
+            server.count('timeouts')
+            if self.path == '/api/post/article':
+                self._create_article(body)
+            time.sleep(server.timeout_delay)
+            return self._send(504, {'code': 504, 'message': 'Gateway Timeout'})
+        roll -= server.timeout_rate
+        if roll < server.error_rate:
+            server.count('errors')
+            status = random.choice((500, 502, 503))
+            return self._send(status, {'code': status, 'message': 'Server Error'})
+
+        if server.cassette is not None:
+            entry = server.cassette.get(request_key(self.path, body, self.headers.get('Content-Type', '')))
+            if entry is not None:
+                server.count('replayed')
+                return self._replay(entry, is_llm)
+
+        server.count('synthesized')
+        if is_llm:
+            return self._chat_completion(body)
+        form = dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+        if self.path == '/api/post/article':
+            article_id = self._create_article(body)
+            if article_id is None:
+                return self._send(200, {'code': 1, 'message': '缺少标题或内容'})
+            return self._send(200, {'code': 0, 'article_id': article_id})
+        if self.path == '/api/article/update':
+            if not form.get('article_id'):
+                return self._send(200, {'code': 1, 'message': '缺少 article_id'})
+            return self._send(200, {'code': 0, 'article_id': form['article_id']})
+        return self._send(404, {'code': 404, 'message': 'Not Found'})
+
+    def _create_article(self, body):
+        form = dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+        if not form.get('title') or not form.get('content'):
+            return None
+        return self.server.create_article(self.headers.get('Idempotency-Key'))
+
+    def _send(self, status, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'application/json')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, status, events, headers=None):
+        """以分块传输编码逐个发送 SSE 事件，events 为 (等待秒数, 事件文本) 的迭代器"""
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'text/event-stream; charset=utf-8')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for delay, event in events:
+            if delay:
+                time.sleep(delay)
+            data = event.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _llm_delays(self, pieces):
+        """把 LLM 的总延迟分为首个分片前的等待和各分片之间的间隔"""
+        total = random.uniform(self.server.llm_latency / 2, self.server.llm_latency * 1.5)
+        first = total / 3
+        return first, (total - first) / max(1, pieces)
+
+    def _chat_completion(self, body):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return self._send(400, {'error': {'message': '请求体不是有效的 JSON'}})
+        messages = request.get('messages') or []
+        system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        user = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        content = json.dumps(synthesize_analysis(system, user), ensure_ascii=False)
+
+        completion_id = f"chatcmpl-stub-{self.server.next_article_id()}"
+        created = int(time.time())
+        model = request.get('model', 'stub')
+        usage = {'prompt_tokens': (len(system) + len(user)) // 2, 'completion_tokens': len(content) // 2}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if not request.get('stream'):
+            time.sleep(sum(self._llm_delays(1)))
+            return self._send(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        self.server.count('streams')
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        first, interval = self._llm_delays(len(pieces))
+
+        def chunk(delta, finish_reason=None, **extra):
+            payload = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                       'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            payload.update(extra)
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def events():
+            yield first, chunk({'role': 'assistant', 'content': ''})
+            for piece in pieces:
+                yield interval, chunk({'content': piece})
+            yield 0, chunk({}, 'stop', usage=usage)
+            yield 0, "data: [DONE]\n\n"
+
+        return self._send_stream(200, events())
+
+    def _replay(self, entry, is_llm):
+        body = entry['body']
+        if not entry.get('stream'):
+            if is_llm:
+                time.sleep(sum(self._llm_delays(1)))
+            return self._send(entry['status'], body.encode('utf-8'), entry.get('headers'))
+
+        self.server.count('streams')
+        events = [event + '\n\n' for event in body.split('\n\n') if event.strip()]
+        first, interval = self._llm_delays(len(events))
+        return self._send_stream(entry['status'], ((first if i == 0 else interval, event)
+                                                   for i, event in enumerate(events)), entry.get('headers'))
+
+    def _proxy(self, body, is_llm):
+        """录制模式：把请求转发到真实服务，原样返回并写入录制文件"""
+        import requests
+
+        server = self.server
+        upstream = server.upstreams['llm' if is_llm else 'lbc']
+        if not upstream:
+            return self._send(502, {'code': 502, 'message': f"未配置 {'LLM' if is_llm else 'LBC'} 上游服务"})
+        url = upstream.rstrip('/') + (LLM_PATH if is_llm else self.path)
+        headers = {key: self.headers[key] for key in ('Content-Type', 'Authorization', 'x-api-key')
+                   if self.headers.get(key)}
+
+        try:
+            response = requests.post(url, data=body, headers=headers, stream=True, timeout=300)
+        except requests.RequestException as e:
+            return self._send(502, {'code': 502, 'message': f"上游请求失败: {e}"})
+
+        entry = {'key': request_key(self.path, body, self.headers.get('Content-Type', '')), 'path': self.path,
+                 'status': response.status_code,
+                 'headers': {key: response.headers[key] for key in RECORDED_HEADERS if key in response.headers},
+                 'stream': 'text/event-stream' in response.headers.get('Content-Type', '')}
+        response.encoding = 'utf-8'  # SSE 响应通常不带 charset
+        if not entry['stream']:
+            entry['body'] = response.text
+            server.cassette.add(entry)
+            server.count('recorded')
+            return self._send(response.status_code, response.content, entry['headers'])
+
+        # 流式响应边转发边记录，转发完成后写入录制文件
+        parts = []
+
+        def events():
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    parts.append(line)
+                    yield 0, line + '\n\n'
+
+        self._send_stream(response.status_code, events(), entry['headers'])
+        entry['body'] = '\n\n'.join(parts)
+        server.cassette.add(entry)
+        server.count('recorded')
+
+
+def synthesize_analysis(system_prompt, user_content):
+    """按提示词生成与 llm_analyze 各提示词输出格式一致的模拟分析结果"""
+    def analyze(text):
+        heading = re.search(r'(?m)^#{1,6}\s+(.+)$', text)
+        first_line = heading.group(1) if heading else text.strip().split('\n', 1)[0]
+        keywords = [word for word in STUB_KEYWORDS if word in text][:6] or ['Solidity']
+        summary = re.sub(r'\s+', ' ', text).strip()[:120]
+        return {'title': first_line.strip()[:18] or '未命名', 'summary': summary, 'keywords': keywords}
+
+    articles = re.split(r'(?m)^=== 文章 (\d+) ===\n', user_content)
+    if len(articles) > 1:
+        # 批量分析：返回 results 数组
+        return {'results': [dict(analyze(text), index=int(index))
+                            for index, text in zip(articles[1::2], articles[2::2])]}
+    result = analyze(user_content)
+    if '"title"' not in system_prompt:
+        # 长文章分块总结只需要 summary 和 keywords
+        result.pop('title')
+    return result
+
+
+def add_server_arguments(parser):
+    """模拟服务的延迟、故障注入和录制参数，replay_harness.py 共用"""
+    parser.add_argument('--latency', type=float, default=0.05, help='LBC 接口平均响应延迟（秒），默认 0.05')
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='LLM 接口平均生成耗时（秒），默认 1')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500/502/503 的比例，默认 0')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='挂起后返回 504 的比例，默认 0')
+    parser.add_argument('--timeout-delay', type=float, default=1.0, help='返回 504 前挂起的秒数，默认 1')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的比例，默认 0')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应中 Retry-After 的秒数，默认 1')
+    parser.add_argument('--cassette', help='录制文件路径（JSON Lines），不带 --record 时用于回放')
+    parser.add_argument('--record', action='store_true', help='转发到上游服务并录制响应到 --cassette')
+    parser.add_argument('--lbc-upstream', help='录制时 LBC 接口的上游地址')
+    parser.add_argument('--llm-upstream', help='录制时 LLM 接口的上游地址，如 https://openrouter.ai/api/v1')
+
+
+def server_options(args):
+    """把 add_server_arguments 解析出的参数转换为 LBCStubServer 的关键字参数"""
+    if args.record and not args.cassette:
+        raise ValueError("--record 需要同时指定 --cassette")
+    return dict(latency=args.latency, llm_latency=args.llm_latency, error_rate=args.error_rate,
+                timeout_rate=args.timeout_rate, timeout_delay=args.timeout_delay,
+                throttle_rate=args.throttle_rate, retry_after=args.retry_after, cassette=args.cassette,
+                record=args.record, lbc_upstream=args.lbc_upstream, llm_upstream=args.llm_upstream)
+
+
+def format_server_stats(stats):
+    return (f"收到 {stats['requests']} 个请求（LLM {stats['llm_requests']}，流式 {stats['streams']}），"
+            f"新建连接 {stats['connections']} 个，模拟错误 {stats['errors']} 次，504 {stats['timeouts']} 次，"
+            f"限流 {stats['throttled']} 次，回放 {stats['replayed']} 次，录制 {stats['recorded']} 次，"
+            f"创建文章 {stats['articles']} 篇（识别重复提交 {stats['deduplicated']} 次）")
+
+
+def start_stub_server(host='127.0.0.1', port=0, **options):
+    """在后台线程中启动模拟服务，port 为 0 时自动选择端口"""
+    server = LBCStubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_benchmark(server, total, workers, content_size):
+    """用 LBC 客户端并发请求模拟服务，输出吞吐和客户端统计"""
+    from lbc_client import CircuitBreaker, LBCClient, format_metrics
+
+    # 压测关注吞吐，关闭熔断，重试等待也缩短
+    client = LBCClient(base_url=server.base_url, api_key='stub', pool_size=workers,
+                       breaker=CircuitBreaker(failure_threshold=0))
+    content = 'x' * content_size
+
+    def update(i):
+        response, _, error = client.post('/api/article/update', {'article_id': i, 'content': content},
+                                         label=f"更新文章 {i}", max_retries=4, retry_delay=0.1)
+        return error is None and response.json().get('code') == 0
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        succeeded = sum(executor.map(update, range(total)))
+    elapsed = time.monotonic() - started
+
+    print("=" * 60)
+    print(f"完成 {total} 个请求（成功 {succeeded}），耗时 {elapsed:.2f} 秒，"
+          f"吞吐 {total / elapsed:.1f} 请求/秒")
+    print(f"客户端: {format_metrics(client.metrics.snapshot())}")
+    print(f"服务端: {format_server_stats(server.stats)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 LBC API / LLM API 模拟服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900, help='监听端口，默认 8900')
+    add_server_arguments(parser)
+    parser.add_argument('--bench', type=int, metavar='N', help='启动后用 LBC 客户端发送 N 个更新请求并输出吞吐')
+    parser.add_argument('--workers', type=int, default=8, help='压测并发数，默认 8')
+    parser.add_argument('--content-size', type=int, default=20000, help='压测时每篇文章的字节数，默认 20000')
+    args = parser.parse_args()
+
+    try:
+        options = server_options(args)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+
+    if args.bench:
+        server = start_stub_server(args.host, 0, **options)
+        run_benchmark(server, args.bench, max(1, args.workers), args.content_size)
+        server.shutdown()
+        return 0
+
+    server = LBCStubServer((args.host, args.port), **options)
+    print(f"模拟服务已启动: {server.base_url}")
+    if server.cassette is not None:
+        print(f"  {'录制到' if args.record else '回放'} {args.cassette}（已有 {len(server.cassette)} 条）")
+    print(f"  设置 LBC_BASE_API_URL={server.base_url}、OPENROUTER_BASE_URL={server.base_url}/v1 "
+          f"后运行发布/更新脚本，Ctrl+C 退出")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print(f"服务端: {format_server_stats(server.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
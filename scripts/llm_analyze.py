@@ -1,27 +1,140 @@
 import openai
+import httpx
+import io
 import os
 import json
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from config import  OPENROUTER_PREFIX, LLM_MODEL_GPT_4O_MINI, MAX_TOKENS, OPENROUTER_MODEL_GEMINI_20_FLASH
+from config import LLM_HTTP_POOL_SIZE, LLM_HTTP_TIMEOUT, LLM_HTTP_CONNECT_TIMEOUT
+from config import ANALYZE_CHUNK_TOKENS, ANALYZE_CHUNK_WORKERS
+from content_cache import mapping_hash
+import llm_cache
+import metrics
 
 
-def process_json_response(json_data_str):
-    """处理JSON响应，如果返回的是数组则取第一个元素"""
+class ConnectionStats:
+    """统计客户端复用情况，以及请求数与新建 TCP 连接数（二者之差即复用连接池的请求数）"""
+
+    def __init__(self):
+        self.clients_created = 0
+        self.client_hits = 0
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        """httpx 请求钩子：挂上 trace 回调以观察是否新建了连接"""
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'clients_created': self.clients_created,
+                'client_hits': self.client_hits,
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused_connections': self.requests - self.new_connections,
+            }
+
+
+connection_stats = ConnectionStats()
+
+# 客户端注册表：按 (base_url, api_key) 复用 OpenAI 客户端及其底层 HTTP 连接池
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, api_key):
+    """获取共用的 OpenAI 兼容客户端，首次使用时按连接池配置创建"""
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            connection_stats.client_hits += 1
+            return client
+
+        http_client = openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=LLM_HTTP_POOL_SIZE,
+                                max_keepalive_connections=LLM_HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT),
+            event_hooks={'request': [connection_stats.on_request]},
+        )
+        client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        _clients[key] = client
+        connection_stats.clients_created += 1
+        return client
+
+
+def get_client_for_model(model):
+    """根据模型前缀选择服务商，返回 (客户端, 实际模型名)，不支持的模型返回 (None, model)"""
+    # API密钥从环境变量读取
+    if model.startswith("gpt-"):
+        return get_client(os.getenv("OPENAI_BASE_URL"), os.getenv("OPENAI_API_KEY")), model
+    if model.startswith(OPENROUTER_PREFIX):
+        return get_client(os.getenv("OPENROUTER_BASE_URL"), os.getenv("OPENROUTER_API_KEY")), model.split(":")[1]
+    return None, model
+
+
+def process_json_response(json_data_str, expect_list=False):
+    """处理JSON响应
+
+    expect_list 为 False 时，如果返回的是数组则取第一个元素；
+    为 True 时（批量分析）总是返回列表：数组原样返回，对象则取其中的 results 数组，
+    单个结果对象包装为只有一个元素的列表。
+    """
     try:
         parsed_data = json.loads(json_data_str)
-        # 如果返回的是数组，取第一个元素
-        if isinstance(parsed_data, list) and len(parsed_data) > 0:
-            print("检测到返回的是数组，提取第一个元素...")
-            return parsed_data[0]
-        return parsed_data
     except json.JSONDecodeError as e:
         print(f"JSON解析错误: {e}")
         raise
 
+    if expect_list:
+        if isinstance(parsed_data, list):
+            return parsed_data
+        if isinstance(parsed_data, dict):
+            if isinstance(parsed_data.get('results'), list):
+                return parsed_data['results']
+            if 'title' in parsed_data:
+                return [parsed_data]
+        raise ValueError(f"返回结果中没有找到结果数组: {json_data_str[:200]}")
 
-def analyze_article(markdown_text, model=OPENROUTER_MODEL_GEMINI_20_FLASH):
-    
-    system_prompt = """
+    # 如果返回的是数组，取第一个元素
+    if isinstance(parsed_data, list) and len(parsed_data) > 0:
+        print("检测到返回的是数组，提取第一个元素...")
+        return parsed_data[0]
+    return parsed_data
+
+
+def is_valid_analysis(result):
+    """检查分析结果是否包含 title、summary、keywords 字段"""
+    return (isinstance(result, dict) and
+            isinstance(result.get('title'), str) and
+            isinstance(result.get('summary'), str) and
+            isinstance(result.get('keywords'), list))
+
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 数：中文字符及全角标点约 1 个 token，其他字符约 4 个字符 1 个 token"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+# 文章分析使用的系统提示词，修改后旧的分析缓存会自动失效
+ANALYZE_SYSTEM_PROMPT = """
 你是编程及区块链技术专家，用户将提供给你一段以太坊智能合约开发相关的内容，请你总结内容，并提取其中的标题、摘要、关键词：
 
 注意：
@@ -32,9 +145,110 @@ def analyze_article(markdown_text, model=OPENROUTER_MODEL_GEMINI_20_FLASH):
     "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词通常为技术术语，最多6个, 尽量使用中文"],
 }
 """
-    model_name = model
-    if model.startswith(OPENROUTER_PREFIX):
-        model_name = model.split(":")[1]
+
+
+# 长文章分块总结（map 阶段）使用的系统提示词
+CHUNK_SUMMARY_SYSTEM_PROMPT = """
+你是编程及区块链技术专家，用户将提供一篇以太坊智能合约开发相关文章中的一个部分，请你总结这一部分的内容，并提取其中的关键词：
+
+注意：
+输出的 JSON 需遵守以下的格式：
+{
+    "summary": "用中文概括这一部分的核心内容，1-3句话即可",
+    "keywords": ["关键词1", "关键词2", "关键词通常为技术术语，最多6个, 尽量使用中文"]
+}
+"""
+
+# 长文章汇总（reduce 阶段）使用的系统提示词，输出格式与 ANALYZE_SYSTEM_PROMPT 相同
+ANALYZE_REDUCE_SYSTEM_PROMPT = """
+你是编程及区块链技术专家，用户将提供一篇以太坊智能合约开发相关文章的原标题，以及按顺序排列的各部分摘要和关键词，请你据此总结整篇文章，并提取其中的标题、摘要、关键词：
+
+注意：
+输出的 JSON 需遵守以下的格式：
+{
+    "title": "中文标题，不超过18个字",
+    "summary": "用中文简明扼要概括核心内容, 1-3句话即可，字数在150字以内，不需要做额外补充，例如：不需要说明文章结构，不需要说明适合什么读者阅读。",
+    "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词通常为技术术语，最多6个, 尽量使用中文"],
+}
+"""
+
+
+# 预处理规则（analysis_text / prepare_article_text）的版本，修改后需递增，使旧的分析缓存失效
+PREPARE_TEXT_VERSION = 2
+
+# 单篇分析缓存键中的"提示词"：结果取决于预处理规则、分析/分块总结/汇总提示词和分块大小，任一变化都会使旧缓存失效
+ANALYZE_CACHE_PROMPT = mapping_hash([ANALYZE_SYSTEM_PROMPT, CHUNK_SUMMARY_SYSTEM_PROMPT, ANALYZE_REDUCE_SYSTEM_PROMPT],
+                                    PREPARE_TEXT_VERSION, ANALYZE_CHUNK_TOKENS)
+
+
+def prepare_article_text(markdown_text):
+    """分析前的预处理：去掉代码块和图片，合并多余的空行，减少发送给大模型的 token"""
+    text = re.sub(r'```.*?```', '', markdown_text, flags=re.DOTALL)
+    text = re.sub(r'!\[[^\]]*\]\([^)]*\)', '', text)
+    text = re.sub(r'<img\b[^>]*>', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\n\s*\n(\s*\n)+', '\n\n', text)
+    return text.strip()
+
+
+def analysis_text(markdown_text, budget):
+    """发送给大模型的文章内容：原文不超出 budget 时原样发送，超出时才用 prepare_article_text 预处理"""
+    if estimate_tokens(markdown_text) <= budget:
+        return markdown_text
+    return prepare_article_text(markdown_text)
+
+
+def split_into_chunks(text, max_tokens):
+    """按标题把文章拆分为估算 token 数不超过 max_tokens 的块
+
+    相邻的小节会合并到同一块中；单个小节过长时按段落拆分，单个段落过长时按字符拆分。
+    """
+    pieces = []
+    for section in re.split(r'(?m)^(?=#{1,6}\s)', text):
+        if not section.strip():
+            continue
+        if estimate_tokens(section) <= max_tokens:
+            pieces.append(section)
+            continue
+        for paragraph in re.split(r'\n\s*\n', section):
+            if estimate_tokens(paragraph) <= max_tokens:
+                pieces.append(paragraph + '\n\n')
+            else:
+                # 按最坏情况（每个字符 1 个 token）切分
+                pieces.extend(paragraph[i:i + max_tokens] for i in range(0, len(paragraph), max_tokens))
+
+    chunks = []
+    current = []
+    used = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and used + tokens > max_tokens:
+            chunks.append(''.join(current).strip())
+            current = []
+            used = 0
+        current.append(piece)
+        used += tokens
+    if current:
+        chunks.append(''.join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+def record_usage(usage):
+    """把响应中的 token 用量计入 metrics 统计（服务商未返回用量时不计）"""
+    metrics.incr('llm_requests')
+    if usage is not None:
+        metrics.incr('llm_prompt_tokens', usage.prompt_tokens or 0)
+        metrics.incr('llm_completion_tokens', usage.completion_tokens or 0)
+
+
+def request_json(model, system_prompt, user_content, expect_list=False, on_field=None):
+    """发送一次要求返回 JSON 的对话请求，返回解析后的结果
+
+    传入 on_field 时以流式方式请求，返回对象的每个顶层字段一生成完毕就回调 on_field(字段名, 值)，
+    首个字段的延迟计入 metrics 的 llm_first_field
+    """
+    client, model_name = get_client_for_model(model)
+    if client is None:
+        raise ValueError(f"不支持的模型: {model}")
 
     request_params = {
         "model": model_name,
@@ -42,48 +256,415 @@ def analyze_article(markdown_text, model=OPENROUTER_MODEL_GEMINI_20_FLASH):
         "temperature": 1.0,   # deepseek 推荐的分析温度, 1.0 也是默认值， 更高结果更发散
         "messages": [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": markdown_text}
+            {"role": "user", "content": user_content}
         ]
     }
+    if on_field is not None:
+        request_params["stream_options"] = {"include_usage": True}
+        stats = {}
+        result = request_llm_with_stream(client, request_params, on_field=on_field, stats=stats)
+        if stats.get('first_field_latency') is not None:
+            metrics.observe('llm_first_field', stats['first_field_latency'])
+        return result
+
+    response = client.chat.completions.create(**request_params)
+    record_usage(response.usage)
 
-    print(f"等待 {model} 大模型返回分析结果...")
+    # 提取返回的JSON字符串
+    json_data = response.choices[0].message.content
+    return process_json_response(json_data, expect_list=expect_list)
 
-    # 初始化客户端，API密钥从环境变量读取
-    if model.startswith("gpt-"):
-        api_key=os.getenv("OPENAI_API_KEY")
-        base_url=os.getenv("OPENAI_BASE_URL")
 
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
-        response = client.chat.completions.create(**request_params)
+def analyze_article(markdown_text, model=OPENROUTER_MODEL_GEMINI_20_FLASH, use_cache=True, on_field=None):
+    """分析文章，返回包含 title、summary、keywords 的字典
+
+    不超出 MAX_TOKENS 预算的文章原样发送；超出预算的文章先去掉代码块和图片，
+    仍然超出预算时按标题分块并发总结，再汇总为同样格式的结果。
+    use_cache 为 True 时，相同内容、模型、提示词和分块设置的分析结果直接从本地缓存返回。
+    传入 on_field 时（最终的）分析请求以流式方式发送，每个字段一生成完毕就回调 on_field(字段名, 值)；
+    命中缓存或未能增量解析时，在返回前补充回调，每个字段都只回调一次
+    """
+    emitted = set()
+
+    def report(key, value):
+        emitted.add(key)
+        on_field(key, value)
 
-        # 提取返回的JSON字符串
-        json_data = response.choices[0].message.content
-        return process_json_response(json_data)
-    elif model.startswith(OPENROUTER_PREFIX):
+    def finish(result):
+        if on_field is not None and isinstance(result, dict):
+            for key, value in result.items():
+                if key not in emitted:
+                    report(key, value)
+        return result
+
+    cache = llm_cache.get_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(markdown_text, model, ANALYZE_CACHE_PROMPT)
+        if cached is not None:
+            print(f"命中 {model} 分析缓存")
+            return finish(cached)
+
+    client, _ = get_client_for_model(model)
+    if client is None:
+        return None
+
+    budget = MAX_TOKENS - estimate_tokens(ANALYZE_SYSTEM_PROMPT)
+    text = analysis_text(markdown_text, budget)
+    tokens = estimate_tokens(text)
+
+    print(f"等待 {model} 大模型返回分析结果（约 {tokens} tokens）...")
+    if model.startswith(OPENROUTER_PREFIX):
         print(f"使用 OpenRouter 模型: {model}")
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        base_url = os.getenv("OPENROUTER_BASE_URL")
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
-        response = client.chat.completions.create(**request_params)
-    
-        json_data = response.choices[0].message.content
-        return process_json_response(json_data)
-    
-    
-def request_llm_with_stream(client, request_params):
+
+    stream_to = report if on_field is not None else None
+    if tokens > budget:
+        result = _analyze_long_article(text, model, on_field=stream_to)
+    else:
+        result = request_json(model, ANALYZE_SYSTEM_PROMPT, text, on_field=stream_to)
+
+    if cache is not None and isinstance(result, dict):
+        cache.put(markdown_text, model, ANALYZE_CACHE_PROMPT, result)
+    return finish(result)
+
+
+def _analyze_long_article(text, model, on_field=None):
+    """长文章的 map-reduce 分析：各块并发总结，再汇总为标题、摘要和关键词"""
+    chunks = split_into_chunks(text, ANALYZE_CHUNK_TOKENS)
+    print(f"文章较长，拆分为 {len(chunks)} 个部分分别总结...")
+
+    def summarize(numbered_chunk):
+        number, chunk = numbered_chunk
+        return request_json(model, CHUNK_SUMMARY_SYSTEM_PROMPT, f"第 {number}/{len(chunks)} 部分：\n\n{chunk}")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(ANALYZE_CHUNK_WORKERS, len(chunks)))) as executor:
+        partials = list(executor.map(summarize, enumerate(chunks, 1)))
+
+    heading = re.search(r'(?m)^#{1,6}\s+(.+)$', text)
+    title = heading.group(1).strip() if heading else text.split('\n', 1)[0].strip()
+    parts = [f"原标题：{title}"]
+    for number, partial in enumerate(partials, 1):
+        partial = partial if isinstance(partial, dict) else {}
+        keywords = '、'.join(str(k) for k in partial.get('keywords', []))
+        parts.append(f"第 {number} 部分摘要：{partial.get('summary', '')}\n第 {number} 部分关键词：{keywords}")
+
+    return request_json(model, ANALYZE_REDUCE_SYSTEM_PROMPT, '\n\n'.join(parts), on_field=on_field)
+
+
+# 批量分析使用的系统提示词，一次请求分析多篇文章
+ANALYZE_BATCH_SYSTEM_PROMPT = """
+你是编程及区块链技术专家，用户将提供多篇以太坊智能合约开发相关的内容，每篇内容以 "=== 文章 编号 ===" 开头，请你分别总结每篇内容，并提取其中的标题、摘要、关键词：
+
+注意：
+输出的 JSON 需遵守以下的格式，results 中每篇文章对应一项，index 为文章编号，不能遗漏任何一篇：
+{
+    "results": [
+        {
+            "index": 0,
+            "title": "中文标题，不超过18个字",
+            "summary": "用中文简明扼要概括核心内容, 1-3句话即可，字数在150字以内，不需要做额外补充，例如：不需要说明文章结构，不需要说明适合什么读者阅读。",
+            "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词通常为技术术语，最多6个, 尽量使用中文"]
+        }
+    ]
+}
+"""
+
+# 批量分析缓存键中的"提示词"：批量提示词及预处理规则版本
+ANALYZE_BATCH_CACHE_PROMPT = mapping_hash([ANALYZE_BATCH_SYSTEM_PROMPT], PREPARE_TEXT_VERSION)
+
+# 批量分析时每篇文章的分隔标记及输出结果预留的 token 数
+BATCH_ITEM_OVERHEAD_TOKENS = 300
+
+
+def pack_articles(token_counts, budget):
+    """按顺序把文章分组，每组的估算 token 数不超过 budget，单篇超出预算的文章单独成组
+
+    Args:
+        token_counts: [(文章下标, 估算 token 数), ...]
+        budget: 每组可用的 token 数
+
+    Returns:
+        list: 每组文章下标的列表
+    """
+    batches = []
+    current = []
+    used = 0
+    for index, tokens in token_counts:
+        cost = tokens + BATCH_ITEM_OVERHEAD_TOKENS
+        if current and used + cost > budget:
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def analyze_articles(markdown_texts, model=OPENROUTER_MODEL_GEMINI_20_FLASH, use_cache=True):
+    """批量分析多篇文章
+
+    在 MAX_TOKENS 预算内把多篇较短的文章合并到一次请求中，要求模型返回结果数组，
+    并按文章编号对应回输入。请求失败或返回结果缺失的文章会拆分后重试，
+    最终单篇重试仍失败的文章对应结果为 None。
+
+    Returns:
+        list: 与 markdown_texts 一一对应的分析结果
+    """
+    results = [None] * len(markdown_texts)
+    cache = llm_cache.get_cache() if use_cache else None
+
+    budget = MAX_TOKENS - estimate_tokens(ANALYZE_BATCH_SYSTEM_PROMPT)
+    pending = []
+    for index, text in enumerate(markdown_texts):
+        cached = cache.get(text, model, ANALYZE_BATCH_CACHE_PROMPT) if cache is not None else None
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append((index, estimate_tokens(analysis_text(text, budget))))
+
+    batches = pack_articles(pending, budget)
+    print(f"批量分析 {len(markdown_texts)} 篇文章: 缓存命中 {len(markdown_texts) - len(pending)} 篇，"
+          f"其余分为 {len(batches)} 次请求")
+
+    for batch in batches:
+        _analyze_batch(markdown_texts, batch, model, results, use_cache)
+
+    return results
+
+
+def _analyze_batch(markdown_texts, indexes, model, results, use_cache):
+    """分析一组文章，把结果写入 results；失败的文章拆分后重试"""
+    if len(indexes) == 1:
+        index = indexes[0]
+        try:
+            results[index] = analyze_article(markdown_texts[index], model=model, use_cache=use_cache)
+        except Exception as e:
+            print(f"分析第 {index} 篇文章失败: {e}")
+            return
+        # analyze_article 按单篇分析的键缓存，同时按批量分析的键保存，下次批量分析时直接命中
+        if use_cache and is_valid_analysis(results[index]):
+            llm_cache.get_cache().put(markdown_texts[index], model, ANALYZE_BATCH_CACHE_PROMPT, results[index])
+        return
+
+    try:
+        items = _request_batch([markdown_texts[i] for i in indexes], model)
+    except Exception as e:
+        print(f"批量分析 {len(indexes)} 篇文章失败: {e}")
+        items = {}
+
+    cache = llm_cache.get_cache() if use_cache else None
+    failed = []
+    for position, index in enumerate(indexes):
+        item = items.get(position)
+        if is_valid_analysis(item):
+            results[index] = item
+            if cache is not None:
+                cache.put(markdown_texts[index], model, ANALYZE_BATCH_CACHE_PROMPT, item)
+        else:
+            failed.append(index)
+
+    if not failed:
+        return
+
+    if len(failed) == len(indexes):
+        # 整组失败：对半拆分后重新批量请求
+        print(f"拆分为两组重试...")
+        middle = len(failed) // 2
+        _analyze_batch(markdown_texts, failed[:middle], model, results, use_cache)
+        _analyze_batch(markdown_texts, failed[middle:], model, results, use_cache)
+    else:
+        # 部分缺失：缺失的文章逐篇重试
+        print(f"返回结果缺少 {len(failed)} 篇文章，逐篇重试...")
+        for index in failed:
+            _analyze_batch(markdown_texts, [index], model, results, use_cache)
+
+
+def _request_batch(texts, model):
+    """发送一次批量分析请求，返回 {组内编号: 结果}"""
+    budget = MAX_TOKENS - estimate_tokens(ANALYZE_BATCH_SYSTEM_PROMPT)
+    user_content = "\n\n".join(f"=== 文章 {position} ===\n{analysis_text(text, budget)}"
+                                 for position, text in enumerate(texts))
+
+    print(f"等待 {model} 大模型返回 {len(texts)} 篇文章的分析结果...")
+    items = request_json(model, ANALYZE_BATCH_SYSTEM_PROMPT, user_content, expect_list=True)
+
+    results = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        item = dict(item)
+        # 优先使用返回的 index，缺失时按顺序对应
+        item_index = item.pop('index', position)
+        if isinstance(item_index, str) and item_index.isdigit():
+            item_index = int(item_index)
+        if isinstance(item_index, int) and 0 <= item_index < len(texts) and item_index not in results:
+            results[item_index] = item
+    return results
+
+
+class StreamingJSONParser:
+    """增量解析流式返回的 JSON 对象
+
+    每收到一段文本就继续解析，顶层对象中的某个字段（如 title、summary、keywords）
+    的值一结束就立即产出，不必等待整个响应生成完毕。第一个 { 之前的内容
+    （如 ```json 标记）会被忽略；如果返回的是数组，解析其中的第一个对象。
+    """
+
+    def __init__(self, on_field=None):
+        self.on_field = on_field
+        self.fields = {}
+        self.first_field_latency = None  # 从开始到第一个字段完成的秒数
+        self._started_at = time.monotonic()
+        self._buffer = io.StringIO()  # 完整的原始响应文本
+        self._started = False
+        self._done = False
+        self._state = 'key'  # key -> colon -> value -> key ...
+        self._token = []
+        self._key = None
+        self._in_string = False
+        self._escape = False
+        self._nest = 0  # 当前字段值内部的嵌套层数
+
+    @property
+    def complete(self):
+        """顶层对象是否已完整结束"""
+        return self._done
+
+    def text(self):
+        return self._buffer.getvalue()
+
+    def feed(self, chunk):
+        """输入一段文本，返回这段文本中完成的 [(字段名, 值), ...]"""
+        self._buffer.write(chunk)
+        completed = []
+        for ch in chunk:
+            if self._done:
+                break
+            field = self._consume(ch)
+            if field is not None:
+                completed.append(field)
+        return completed
+
+    def _consume(self, ch):
+        if not self._started:
+            self._started = ch == '{'
+            return None
+
+        if self._state == 'key':
+            if self._in_string:
+                if self._read_string_char(ch):
+                    self._key = json.loads('"' + ''.join(self._token) + '"')
+                    self._state = 'colon'
+            elif ch == '"':
+                self._in_string = True
+                self._token = []
+            elif ch == '}':
+                self._done = True
+            return None
+
+        if self._state == 'colon':
+            if ch == ':':
+                self._state = 'value'
+                self._token = []
+                self._nest = 0
+            return None
+
+        # 读取字段值
+        if self._in_string:
+            self._token.append(ch)
+            if self._read_string_char(ch, keep=False) and self._nest == 0:
+                return self._finish_value()
+            return None
+        if not self._token and ch.isspace():
+            return None
+        if ch == '"':
+            self._in_string = True
+            self._token.append(ch)
+        elif ch in '{[':
+            self._nest += 1
+            self._token.append(ch)
+        elif ch in '}]':
+            if self._nest == 0:
+                # 数字、true/false/null 等标量值后紧跟顶层对象的结束
+                self._done = True
+                return self._finish_value()
+            self._nest -= 1
+            self._token.append(ch)
+            if self._nest == 0:
+                return self._finish_value()
+        elif ch == ',' and self._nest == 0:
+            return self._finish_value()
+        else:
+            self._token.append(ch)
+        return None
+
+    def _read_string_char(self, ch, keep=True):
+        """处理字符串中的一个字符，返回字符串是否在此结束"""
+        if self._escape:
+            self._escape = False
+        elif ch == '\\':
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            return True
+        if keep:
+            self._token.append(ch)
+        return False
+
+    def _finish_value(self):
+        value = json.loads(''.join(self._token))
+        key = self._key
+        self.fields[key] = value
+        self._state = 'key'
+        self._token = []
+        if self.first_field_latency is None:
+            self.first_field_latency = time.monotonic() - self._started_at
+        if self.on_field is not None:
+            self.on_field(key, value)
+        return key, value
+
+    def stats(self):
+        return {
+            'first_field_latency': self.first_field_latency,
+            'total_latency': time.monotonic() - self._started_at,
+            'fields': list(self.fields),
+        }
+
+
+def request_llm_with_stream(client, request_params, model=None, on_field=None, stats=None):
+    """以流式方式请求大模型，并边接收边解析 JSON
+
+    client 为 None 时按 model 从客户端注册表获取共用客户端。
+    on_field(字段名, 值) 在每个顶层字段完成时立即回调；传入 stats 字典时，
+    会写入首个字段延迟 first_field_latency 和总耗时 total_latency（秒）。
+    """
+    if client is None:
+        client, model_name = get_client_for_model(model)
+        request_params.setdefault("model", model_name)
 
     request_params["stream"] = True
+    parser = StreamingJSONParser(on_field=on_field)
     response = client.chat.completions.create(**request_params)
 
-    responseContent = ""
+    usage = None
     for chunk in response:
-        if chunk and chunk.choices[0].delta.content:
-            answer_chunk = chunk.choices[0].delta.content
-            if answer_chunk and answer_chunk != "":
-                    responseContent += answer_chunk
+        if chunk and getattr(chunk, 'usage', None):
+            usage = chunk.usage  # 部分服务商在最后一个分片中返回用量
+        if chunk and chunk.choices and chunk.choices[0].delta.content:
+            parser.feed(chunk.choices[0].delta.content)
+    record_usage(usage)
 
+    if stats is not None:
+        stats.update(parser.stats())
+
+    responseContent = parser.text()
     print(f"responseContent: {responseContent}")
+    if parser.complete:
+        return parser.fields
+
+    # 未能增量解析出完整对象时，按原方式整体解析
     # 去掉 responseContent 中的 ```json 和 ```
     responseContent = responseContent.replace("```json", "").replace("```", "")
 
-    return process_json_response(responseContent)
\ No newline at end of file
+    return process_json_response(responseContent)
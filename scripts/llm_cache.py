@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 分析结果缓存
+
+以文章内容哈希、模型 id 和系统提示词哈希为键，把 analyze_article 返回的
+title/summary/keywords 保存在本地 SQLite 中。内容未变的文章（如 --force 重新发布）
+再次分析时直接返回缓存结果，不再请求大模型。
+
+修改 analyze_article 的提示词后，旧结果因键不同自动失效，可用 --prune 清理。
+
+用法:
+  python llm_cache.py --stats     # 查看缓存条目数
+  python llm_cache.py --prune     # 删除与当前单篇/批量分析提示词都不匹配的条目
+  python llm_cache.py --clear     # 清空缓存
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from content_cache import CACHE_DIR, content_hash
+
+DEFAULT_CACHE_PATH = CACHE_DIR / "llm_analysis.sqlite3"
+DEFAULT_TTL = 30 * 24 * 3600  # 缓存有效期：30 天
+DEFAULT_MAX_ENTRIES = 5000  # 超过后按最近使用时间淘汰
+
+
+class AnalysisCache:
+    """基于 SQLite 的分析结果缓存，支持 TTL 过期和 LRU 淘汰，可在多线程中共用"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_last_used ON analysis (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content, model, prompt):
+        """缓存键：内容哈希 + 模型 id + 提示词哈希"""
+        return content_hash("\0".join([content_hash(content), model, content_hash(prompt)]))
+
+    def get(self, content, model, prompt):
+        """查询缓存，未命中或已过期时返回 None"""
+        key = self.make_key(content, model, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM analysis WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE analysis SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, content, model, prompt, result):
+        """写入分析结果，并淘汰超出容量的最久未使用条目"""
+        key = self.make_key(content, model, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, model, prompt_hash, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content_hash(prompt), json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM analysis WHERE key IN ("
+                "  SELECT key FROM analysis ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def invalidate(self, keep_prompts=None):
+        """删除缓存条目；指定 keep_prompts（提示词集合）时只保留使用其中提示词得到的结果，返回删除的条目数"""
+        with self._lock:
+            if keep_prompts is None:
+                cursor = self._conn.execute("DELETE FROM analysis")
+            else:
+                hashes = sorted({content_hash(prompt) for prompt in keep_prompts})
+                placeholders = ", ".join("?" * len(hashes))
+                cursor = self._conn.execute(
+                    f"DELETE FROM analysis WHERE prompt_hash NOT IN ({placeholders})", hashes
+                )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self.count()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取进程内共用的缓存实例"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='管理 LLM 分析结果缓存')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--stats', action='store_true', help='查看缓存条目数（默认）')
+    group.add_argument('--prune', action='store_true', help='删除与当前单篇/批量分析提示词都不匹配的条目')
+    group.add_argument('--clear', action='store_true', help='清空缓存')
+    args = parser.parse_args()
+
+    cache = get_cache()
+    if args.prune:
+        from llm_analyze import ANALYZE_BATCH_CACHE_PROMPT, ANALYZE_CACHE_PROMPT
+        removed = cache.invalidate(keep_prompts={ANALYZE_CACHE_PROMPT, ANALYZE_BATCH_CACHE_PROMPT})
+        print(f"已删除 {removed} 个过期提示词的缓存条目")
+    elif args.clear:
+        print(f"已删除 {cache.invalidate()} 个缓存条目")
+    print(f"缓存文件: {cache.path}")
+    print(f"缓存条目: {cache.count()} 个")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
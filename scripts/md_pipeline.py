@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown 一次读写的处理流水线
+
+把原来分散在各脚本中、各自读写文件的处理步骤组织为流水线上的阶段：
+
+  eip     EIP 链接替换为登链社区镜像（replace_terms.mirror_eip_links）
+  terms   术语链接（replace_terms.add_links_to_content）
+  links   本地 .md 引用替换为已发布文章 URL（update_md_links.update_markdown_links）
+  images  外部图片迁移到 CDN（migrate_images，需要又拍云账号，默认不启用）
+
+每个文件只读取一次，各阶段依次处理内存中的同一份文档，区域索引在内容未变化时由各阶段共用，
+全部完成后内容有变化才原子地写回。结束时输出各阶段耗时。
+
+用法:
+  python md_pipeline.py                          # 对 docs 目录执行 eip、terms、links
+  python md_pipeline.py ../docs/solidity-adv --stages eip,links
+  python md_pipeline.py --stages eip,terms,links,images --dry-run
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from replace_terms import (DEFAULT_TERMLINK_PATH, MarkdownRegions, TermMatcher,
+                           add_links_to_content, extract_terms_and_links, mirror_eip_links)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BASE_DIR / "docs"
+
+DEFAULT_STAGES = ('eip', 'terms', 'links')
+
+
+class Document:
+    """流水线中的文档：内容在各阶段之间传递，区域索引按内容缓存"""
+
+    def __init__(self, path, content):
+        self.path = Path(path)
+        self.original = content
+        self._content = content
+        self._regions = {}
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        if value != self._content:
+            self._content = value
+            self._regions = {}  # 内容变化后索引失效
+
+    @property
+    def changed(self):
+        return self._content != self.original
+
+    def regions(self, kinds=MarkdownRegions.ALL_KINDS):
+        """当前内容的区域索引，内容未变化时各阶段共用同一份"""
+        regions = self._regions.get(kinds)
+        if regions is None:
+            regions = self._regions[kinds] = MarkdownRegions(self._content, kinds=kinds)
+        return regions
+
+
+class Stage:
+    """流水线阶段：apply 修改文档内容，commit 在文件处理完成（需要时已写回）后调用，close 在全部文件处理完后调用
+
+    dry_run 为 True 时 apply 只计算新内容，不能产生任何外部副作用（上传、写缓存等）
+    """
+
+    name = None
+
+    def apply(self, doc, dry_run=False):
+        raise NotImplementedError
+
+    def commit(self, doc):
+        pass
+
+    def close(self):
+        pass
+
+
+class EipMirrorStage(Stage):
+    name = 'eip'
+
+    def apply(self, doc, dry_run=False):
+        doc.content = mirror_eip_links(doc.content)
+
+
+class TermLinkStage(Stage):
+    name = 'terms'
+
+    def __init__(self, terms_dict):
+        self.terms_dict = terms_dict
+        self.matcher = TermMatcher(terms_dict)
+
+    def apply(self, doc, dry_run=False):
+        doc.content = add_links_to_content(doc.content, self.terms_dict, self.matcher, doc.regions())
+
+
+class PublishedLinkStage(Stage):
+    name = 'links'
+
+    def __init__(self, base_dir=BASE_DIR, use_graph=True):
+        from update_md_links import (LINK_GRAPH_PATH, LinkGraph, build_path_to_url_map,
+                                     load_published_articles)
+        from published_store import PUBLISHED_ARTICLES_FILE
+
+        self.base_dir = base_dir
+        self.path_to_url = build_path_to_url_map(load_published_articles(PUBLISHED_ARTICLES_FILE),
+                                                 base_dir, PUBLISHED_ARTICLES_FILE.resolve().parent)
+        self.graph = LinkGraph(LINK_GRAPH_PATH, base_dir) if use_graph else None
+        self._linked = {}
+
+    def apply(self, doc, dry_run=False):
+        from update_md_links import canonical_path, update_file_links
+
+        source = canonical_path(doc.path.resolve(), self.base_dir)
+        content, _, linked = update_file_links(doc.content, self.path_to_url, source, self.base_dir,
+                                               self.graph)
+        self._linked[doc.path] = linked
+        doc.content = content
+
+    def commit(self, doc):
+        if self.graph is not None:
+            self.graph.update_file(doc.path.resolve(), doc.content, self._linked.pop(doc.path, None))
+
+    def close(self):
+        if self.graph is not None:
+            self.graph.save(self.path_to_url)
+
+
+class ImageMigrationStage(Stage):
+    name = 'images'
+
+    def __init__(self, workers=8, optimize=None, dry_run=False):
+        self.upload_imgs = None
+        if not dry_run:
+            from upyun_upload import upload_imgs  # 未配置又拍云账号时在这里报错
+            self.upload_imgs = upload_imgs
+        self.workers = workers
+        self.optimize = optimize
+
+    def apply(self, doc, dry_run=False):
+        from migrate_images import find_image_refs, rewrite_image_refs
+
+        refs = find_image_refs(doc.content, doc.regions(MarkdownRegions.CODE_KINDS))
+        if not refs:
+            return
+        if dry_run or self.upload_imgs is None:
+            # 与 migrate_images --dry-run 相同，只列出需要迁移的图片，不上传
+            for url in dict.fromkeys(url for _, _, url in refs):
+                print(f"  {doc.path}: {url}")
+            return
+        url_map = self.upload_imgs([url for _, _, url in refs], workers=self.workers,
+                                   optimize=self.optimize)
+        doc.content, _ = rewrite_image_refs(doc.content, refs, url_map)
+
+
+def atomic_write(path, content):
+    """先写入同目录下的临时文件再替换，避免中断时留下写了一半的文件"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.' + path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        mode = os.stat(path).st_mode & 0o777 if path.exists() else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class Pipeline:
+    """按顺序对每个文件执行各阶段，统计每个阶段的耗时和修改的文件数"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.timings = {name: 0.0 for name in ['read'] + [s.name for s in self.stages] + ['write']}
+        self.changed_by = {stage.name: 0 for stage in self.stages}
+        self.files = 0
+        self.files_changed = 0
+
+    def run_file(self, path, dry_run=False):
+        """处理单个文件，返回内容是否变化"""
+        started = time.perf_counter()
+        with open(path, 'r', encoding='utf-8') as f:
+            doc = Document(path, f.read())
+        self.timings['read'] += time.perf_counter() - started
+
+        for stage in self.stages:
+            before = doc.content
+            started = time.perf_counter()
+            stage.apply(doc, dry_run)
+            self.timings[stage.name] += time.perf_counter() - started
+            if doc.content != before:
+                self.changed_by[stage.name] += 1
+
+        self.files += 1
+        if doc.changed:
+            self.files_changed += 1
+        if not dry_run:
+            started = time.perf_counter()
+            if doc.changed:
+                atomic_write(path, doc.content)
+            for stage in self.stages:
+                stage.commit(doc)
+            self.timings['write'] += time.perf_counter() - started
+        return doc.changed
+
+    def run(self, paths, dry_run=False):
+        for path in paths:
+            try:
+                if self.run_file(path, dry_run):
+                    print(f"✓ {'[DRY RUN] 将更新' if dry_run else '已更新'}: {path}")
+            except Exception as e:
+                print(f"✗ 处理 {path} 时出错: {e}")
+        if not dry_run:
+            for stage in self.stages:
+                stage.close()
+
+    def report(self):
+        total = sum(self.timings.values())
+        print(f"处理 {self.files} 个文件，{self.files_changed} 个有变化，总耗时 {total:.3f} 秒")
+        for name, seconds in self.timings.items():
+            changed = f"，修改 {self.changed_by[name]} 个文件" if name in self.changed_by else ""
+            share = seconds * 100 / total if total else 0
+            print(f"  {name:<8} {seconds * 1000:9.1f} ms ({share:4.1f}%){changed}")
+
+
+def build_stages(names, termlink_path=DEFAULT_TERMLINK_PATH, workers=8, dry_run=False):
+    stages = []
+    for name in names:
+        if name == 'eip':
+            stages.append(EipMirrorStage())
+        elif name == 'terms':
+            terms_dict = extract_terms_and_links(termlink_path)
+            print(f"从 {termlink_path} 中找到 {len(terms_dict)} 个术语")
+            stages.append(TermLinkStage(terms_dict))
+        elif name == 'links':
+            stages.append(PublishedLinkStage())
+        elif name == 'images':
+            stages.append(ImageMigrationStage(workers=workers, dry_run=dry_run))
+        else:
+            raise ValueError(f"未知的阶段: {name}")
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='一次读写完成 Markdown 文档的各项处理')
+    parser.add_argument('paths', nargs='*', help=f'要处理的文件或目录，默认 {DOCS_DIR}')
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES),
+                        help='按顺序执行的阶段，逗号分隔，可选 eip,terms,links,images，默认 eip,terms,links')
+    parser.add_argument('--termlink', default=DEFAULT_TERMLINK_PATH, help='术语链接文件 termlink.md 的路径')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='images 阶段的并发上传数，默认 8')
+    parser.add_argument('--dry-run', action='store_true', help='只报告将要修改的文件，不写回')
+    args = parser.parse_args()
+
+    paths = []
+    for path in map(Path, args.paths or [DOCS_DIR]):
+        paths.extend(sorted(path.rglob('*.md')) if path.is_dir() else [path])
+
+    try:
+        stages = build_stages([s.strip() for s in args.stages.split(',') if s.strip()],
+                              args.termlink, max(1, args.workers), args.dry_run)
+    except Exception as e:
+        print(f"✗ 初始化流水线失败: {e}")
+        return 1
+
+    pipeline = Pipeline(stages)
+    pipeline.run(paths, dry_run=args.dry_run)
+    print("=" * 60)
+    pipeline.report()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发布流程的耗时与计数统计
+
+在发布流程的各个环节埋点：
+  read             读取文章文件
+  analyze          LLM 分析文章（analyze_article）
+  llm_first_field  流式分析请求从发出到第一个字段生成完毕
+  post             发布请求（post_article，含重试）
+  retry_wait       LBC 客户端重试前的等待
+  rate_limit_wait  LBC API 限速等待
+  record_save      保存发布记录
+以及计数：LLM 使用的 token 数（llm_prompt_tokens / llm_completion_tokens）、
+发送给 LBC API 的字节数（lbc_bytes_sent）等。
+
+默认关闭，关闭时 span() 返回共用的空上下文，observe() / incr() 只做一次判断，几乎没有开销。
+开启后可输出本次运行的汇总、JSON Lines 明细或 Prometheus 文本格式。
+
+用法:
+  import metrics
+  metrics.enable()
+  with metrics.span('read', file=path):
+      ...
+  metrics.incr('lbc_bytes_sent', len(data))
+  print(metrics.format_summary())
+"""
+
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+PROMETHEUS_PREFIX = 'lbc_publish'
+
+_NOOP_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ('_metrics', '_name', '_labels', '_started')
+
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self._labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        self._metrics.observe(self._name, time.perf_counter() - self._started, **labels)
+        return False
+
+
+class Metrics:
+    """一次运行的统计：各环节的耗时分布、计数器，以及开启明细时的逐条记录"""
+
+    def __init__(self):
+        self.enabled = False
+        self.keep_events = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.timers = {}  # 名称 -> 每次耗时（秒）
+            self.counters = {}
+            self.events = []
+
+    def span(self, name, **labels):
+        """计时上下文，退出时把耗时记入 name"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        """记录一次已知的耗时（如重试前 sleep 的秒数）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.timers.setdefault(name, []).append(seconds)
+            if self.keep_events:
+                self.events.append(dict(labels, type='span', name=name, seconds=round(seconds, 6),
+                                        ts=round(time.time(), 3), thread=threading.current_thread().name))
+
+    def incr(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        with self._lock:
+            timers = {}
+            for name, values in self.timers.items():
+                values = sorted(values)
+                timers[name] = {
+                    'count': len(values),
+                    'total': sum(values),
+                    'p50': values[min(len(values) - 1, int(len(values) * 0.5))],
+                    'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                    'max': values[-1],
+                }
+            return {
+                'started_at': self.started_at,
+                'elapsed': time.time() - self.started_at,
+                'timers': timers,
+                'counters': dict(self.counters),
+            }
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """获取进程内共用的统计实例"""
+    return _metrics
+
+
+def enable(keep_events=False):
+    """开启统计，keep_events 为 True 时保留逐条记录用于导出 JSON Lines"""
+    _metrics.reset()
+    _metrics.keep_events = keep_events
+    _metrics.enabled = True
+
+
+def is_enabled():
+    return _metrics.enabled
+
+
+def span(name, **labels):
+    return _metrics.span(name, **labels)
+
+
+def observe(name, seconds, **labels):
+    _metrics.observe(name, seconds, **labels)
+
+
+def incr(name, value=1):
+    _metrics.incr(name, value)
+
+
+def format_summary(summary=None):
+    """把 summary() 的结果格式化为多行文字"""
+    summary = summary or _metrics.summary()
+    elapsed = summary['elapsed']
+    lines = [f"耗时统计（运行 {elapsed:.1f} 秒，并发环节的合计耗时可能超过运行时间）:"]
+    for name, t in sorted(summary['timers'].items(), key=lambda item: -item[1]['total']):
+        lines.append(f"  {name:<16} {t['count']:>5} 次  合计 {t['total']:8.2f} 秒  "
+                     f"p50 {t['p50'] * 1000:8.1f}ms  p95 {t['p95'] * 1000:8.1f}ms  最大 {t['max'] * 1000:8.1f}ms")
+    if summary['counters']:
+        lines.append("计数: " + "，".join(f"{name} {value}" for name, value in sorted(summary['counters'].items())))
+    return "\n".join(lines)
+
+
+def write_jsonl(path):
+    """把逐条记录和最后的汇总追加写入 JSON Lines 文件"""
+    summary = _metrics.summary()
+    with open(path, 'a', encoding='utf-8') as f:
+        for event in list(_metrics.events):
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        f.write(json.dumps(dict(summary, type='summary'), ensure_ascii=False) + '\n')
+
+
+def to_prometheus(summary=None):
+    """Prometheus 文本格式：各环节耗时为 summary 类型，计数器为 counter 类型"""
+    summary = summary or _metrics.summary()
+    name = f"{PROMETHEUS_PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} Time spent in each publish stage.", f"# TYPE {name} summary"]
+    for stage, t in sorted(summary['timers'].items()):
+        lines.append(f'{name}{{stage="{stage}",quantile="0.5"}} {t["p50"]:.6f}')
+        lines.append(f'{name}{{stage="{stage}",quantile="0.95"}} {t["p95"]:.6f}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {t["total"]:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {t["count"]}')
+    for counter, value in sorted(summary['counters'].items()):
+        counter_name = f"{PROMETHEUS_PREFIX}_{counter}_total"
+        lines.append(f"# TYPE {counter_name} counter")
+        lines.append(f"{counter_name} {value}")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge")
+    lines.append(f"{PROMETHEUS_PREFIX}_run_seconds {summary['elapsed']:.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(to_prometheus())
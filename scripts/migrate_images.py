@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把 Markdown 文档中引用的外部图片迁移到又拍云 CDN
+
+扫描文档中的 ![...](url) 和 <img src="url"> 引用（跳过代码块和行内代码），
+对整个文档集合中的外部图片去重后并发上传，再把每个文件中的引用一次性改写为 CDN 地址。
+
+用法:
+  python migrate_images.py                        # 处理 docs 目录下的所有文档
+  python migrate_images.py ../docs/solidity-adv   # 处理指定目录或文件
+  python migrate_images.py --dry-run              # 只列出需要迁移的图片
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+from config import IMAGE_CDN_PREFIX
+from replace_terms import MarkdownRegions
+
+DOCS_DIR = Path(__file__).parent.parent / "docs"
+
+# 分组 2 为图片地址
+MARKDOWN_IMAGE_RE = re.compile(r'(!\[[^\]\n]*\]\(\s*<?)([^)\s>]+)')
+HTML_IMAGE_RE = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*["\']?)([^"\'\s>]+)', re.IGNORECASE)
+
+
+def needs_migration(url):
+    """只迁移 http(s) 外部图片，已在 CDN 上的图片和相对路径保持不变"""
+    return url.startswith(('http://', 'https://')) and not url.startswith(IMAGE_CDN_PREFIX)
+
+
+def find_image_refs(content, regions=None):
+    """返回文档中需要迁移的图片引用 [(start, end, url)]，按位置排序
+
+    regions 为按 MarkdownRegions.CODE_KINDS 建立的区域索引，不传时按需建立
+    """
+    refs = []
+    for pattern in (MARKDOWN_IMAGE_RE, HTML_IMAGE_RE):
+        for m in pattern.finditer(content):
+            url = m.group(2)
+            if not needs_migration(url):
+                continue
+            if regions is None:
+                regions = MarkdownRegions(content, kinds=MarkdownRegions.CODE_KINDS)
+            if regions.is_excluded(m.start()):
+                continue
+            refs.append((m.start(2), m.end(2), url))
+    refs.sort()
+    return refs
+
+
+def rewrite_image_refs(content, refs, url_map):
+    """把引用替换为 CDN 地址，未迁移成功的图片保留原地址，返回 (新内容, 替换数)"""
+    parts = []
+    last = 0
+    replaced = 0
+    for start, end, url in refs:
+        cdn_url = url_map.get(url)
+        if not cdn_url or cdn_url == url:
+            continue
+        parts.append(content[last:start])
+        parts.append(cdn_url)
+        last = end
+        replaced += 1
+    parts.append(content[last:])
+    return ''.join(parts), replaced
+
+
+def collect_markdown_files(paths):
+    """展开目录，返回去重排序后的 .md 文件列表"""
+    files = set()
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.update(path.rglob('*.md'))
+        elif path.suffix == '.md':
+            files.add(path)
+    return sorted(files)
+
+
+def migrate_files(file_paths, workers=8, dry_run=False, optimize=None):
+    """
+    迁移多个文档中的外部图片
+
+    每个文件只读取一次；只有包含外部图片的文件会保留内容并在迁移后改写。
+    optimize 为 image_optimize.make_options() 的结果时，上传前先压缩图片。
+
+    Returns:
+        dict: {'files', 'images', 'migrated', 'failed', 'rewritten_files', 'rewritten_refs'}
+    """
+    pending = {}  # 文件路径 -> (内容, 引用列表)
+    urls = {}
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            print(f"读取文件 {file_path} 时出错: {e}")
+            continue
+        refs = find_image_refs(content)
+        if refs:
+            pending[file_path] = (content, refs)
+            for _, _, url in refs:
+                urls.setdefault(url, file_path)
+
+    stats = {'files': len(file_paths), 'images': len(urls), 'migrated': 0, 'failed': 0,
+             'rewritten_files': 0, 'rewritten_refs': 0}
+    if not urls:
+        return stats
+
+    if dry_run:
+        for url, file_path in urls.items():
+            print(f"  {file_path}: {url}")
+        return stats
+
+    # 需要上传时才导入，未配置又拍云账号时 --dry-run 仍可使用
+    from upyun_upload import upload_imgs
+
+    url_map = upload_imgs(list(urls), workers=workers, optimize=optimize)
+    stats['migrated'] = sum(1 for url in urls if url_map.get(url))
+    stats['failed'] = len(urls) - stats['migrated']
+    for url in urls:
+        if not url_map.get(url):
+            print(f"  ✗ 图片迁移失败，保留原地址: {url}")
+
+    for file_path, (content, refs) in pending.items():
+        new_content, replaced = rewrite_image_refs(content, refs, url_map)
+        if not replaced:
+            continue
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(new_content)
+        stats['rewritten_files'] += 1
+        stats['rewritten_refs'] += replaced
+        print(f"  已改写 {file_path}: {replaced} 处图片引用")
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把文档中的外部图片迁移到又拍云 CDN')
+    parser.add_argument('paths', nargs='*', help=f'要处理的文件或目录，默认 {DOCS_DIR}')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='并发上传数，默认 8')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要迁移的图片，不上传也不改写文件')
+    parser.add_argument('--optimize', action='store_true', help='上传前压缩图片（需要 Pillow）')
+    parser.add_argument('--max-width', type=int, help='压缩时把宽度超过该值的图片等比缩小')
+    parser.add_argument('--jpeg-quality', type=int, metavar='Q', help='压缩时 JPEG 按该质量有损重新编码，默认不处理 JPEG')
+    args = parser.parse_args()
+
+    optimize = None
+    if args.optimize:
+        import image_optimize
+        if image_optimize.is_available():
+            optimize = image_optimize.make_options(args.max_width, jpeg_quality=args.jpeg_quality)
+        else:
+            print("⚠️  未安装 Pillow，跳过图片压缩")
+
+    files = collect_markdown_files(args.paths or [DOCS_DIR])
+    print(f"扫描 {len(files)} 个文档...")
+    stats = migrate_files(files, workers=max(1, args.workers), dry_run=args.dry_run, optimize=optimize)
+
+    print("=" * 60)
+    print(f"外部图片: {stats['images']} 张（去重后）")
+    if not args.dry_run:
+        print(f"迁移成功: {stats['migrated']} 张，失败: {stats['failed']} 张")
+        print(f"改写文件: {stats['rewritten_files']} 个，共 {stats['rewritten_refs']} 处引用")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,18 +1,66 @@
-import requests
-import os
 import sys
-import json
 import time
-from datetime import datetime, timedelta
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
 from pathlib import Path
 
-from config import LBC_BASE_API_URL, LBC_API_KEY
-from urllib.parse import urlencode
-
 import llm_analyze
+import llm_cache
+import metrics
+from config import LBC_CREATE_READ_TIMEOUT, LBC_HTTP_TIMEOUT
+from content_cache import content_hash
+from lbc_client import format_metrics, get_client
+from published_store import PUBLISHED_ARTICLES_FILE, get_store
+
+
+class TokenBucket:
+    """令牌桶限速器：平均每秒放行 rate 个请求，最多允许 capacity 个突发请求"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            metrics.observe('rate_limit_wait', wait)
+            time.sleep(wait)
+
 
-# 发布记录配置文件路径
-PUBLISHED_ARTICLES_FILE = Path(__file__).parent / "published_articles.json"
+class PublishLimits:
+    """批量发布时各阶段的并发限制：LLM 分析和 LBC API 请求分别限制并发数，API 请求另外限速"""
+
+    def __init__(self, llm_workers=4, api_workers=2, api_rate=1.0):
+        self.llm_workers = llm_workers
+        self.api_workers = api_workers
+        self._llm = threading.BoundedSemaphore(llm_workers)
+        self._api = threading.BoundedSemaphore(api_workers)
+        self._api_rate = TokenBucket(api_rate)
+
+    def llm_stage(self):
+        return self._llm
+
+    @contextmanager
+    def api_stage(self):
+        with self._api:
+            self._api_rate.acquire()
+            yield
 
 def first_line_of_file(filename):
     """读取文件的第一行（非空行）"""
@@ -38,50 +86,55 @@ def trim_summary(summary, max_length=200):
 
 def load_published_articles():
     """加载已发布文章记录"""
-    if not PUBLISHED_ARTICLES_FILE.exists():
-        return {}
-    
-    try:
-        with open(PUBLISHED_ARTICLES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取发布记录文件时出错: {e}")
-        return {}
+    return get_store(PUBLISHED_ARTICLES_FILE).all()
 
-def save_published_article(filename, lbc_article_id):
-    """保存已发布文章记录"""
-    published = load_published_articles()
-    
-    published[filename] = {
+def save_published_article(filename, lbc_article_id, content=None):
+    """保存已发布文章记录，content 为发布的文章内容，记录其哈希用于之后的增量更新"""
+    info = {
         'lbc_article_id': lbc_article_id,
         'published_at': datetime.now().isoformat()
     }
-    
+    if content is not None:
+        info['content_sha256'] = content_hash(content)
     try:
-        with open(PUBLISHED_ARTICLES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(published, f, ensure_ascii=False, indent=2)
+        with metrics.span('record_save'):
+            get_store(PUBLISHED_ARTICLES_FILE).put(filename, info)
         print(f"已记录发布信息到 {PUBLISHED_ARTICLES_FILE}")
     except Exception as e:
         print(f"保存发布记录时出错: {e}")
 
 def is_article_published(filename):
     """检查文章是否已发布"""
-    published = load_published_articles()
-    return filename in published
+    return get_store(PUBLISHED_ARTICLES_FILE).contains(filename)
 
 def get_published_info(filename):
     """获取已发布文章的信息"""
-    published = load_published_articles()
-    return published.get(filename)
+    return get_store(PUBLISHED_ARTICLES_FILE).get(filename)
+
+
+def migrate_article_images(file_paths):
+    """发布前把文章中的外部图片迁移到 CDN，失败时只给出警告，不影响发布"""
+    try:
+        import migrate_images
+        stats = migrate_images.migrate_files([Path(p) for p in file_paths])
+        if stats['images']:
+            print(f"图片迁移: {stats['migrated']}/{stats['images']} 张外部图片已迁移到 CDN，"
+                  f"改写 {stats['rewritten_files']} 个文件")
+        if stats['failed']:
+            print(f"⚠️  {stats['failed']} 张图片迁移失败，文章中保留原地址")
+    except Exception as e:
+        print(f"⚠️  迁移文章图片失败: {e}，使用原图片地址发布")
 
 
-def publish_article(filename, force=False):
+def publish_article(filename, force=False, limits=None, migrate_images=True):
     """
     发布文章
     
     Args:
         filename: 文章文件路径
         force: 如果为 True，即使已发布过也会重新发布
+        limits: PublishLimits，批量并发发布时限制各阶段的并发数
+        migrate_images: 发布前是否把文章中的外部图片迁移到 CDN
     """
     # 检查是否已发布
     if not force and is_article_published(filename):
@@ -91,23 +144,41 @@ def publish_article(filename, force=False):
         print(f"   发布时间: {published_info.get('published_at')}")
         print(f"   如需重新发布，请使用 force=True 参数")
         return published_info.get('lbc_article_id')
-    
-    content = open(filename, "r").read()
 
-    title = first_line_of_file(filename).replace("# ", "").strip()
+    if migrate_images:
+        migrate_article_images([filename])
+
+    with metrics.span('read', file=filename):
+        content = open(filename, "r").read()
+        title = first_line_of_file(filename).replace("# ", "").strip()
 
     # 使用 LLM 分析文章，获取摘要和关键词
+    # 分析结果以流式返回，title、summary、keywords 每生成完一个就转换为对应的发布参数
+    prepared = {}
+
+    def on_field(key, value):
+        if key == 'title':
+            prepared['title'] = value.replace("详解", "")
+            print(f"分析完成 - title: {prepared['title']} ")
+        elif key == 'summary':
+            prepared['summary'] = trim_summary(value)
+        elif key == 'keywords':
+            tags = ','.join(value) if value else "Solidity"
+            if "Solidity" not in tags:
+                tags = tags + ",Solidity"
+            prepared['tags'] = tags
+            print(f"分析完成 - 关键词: {tags}")
+
     try:
         print(f"正在分析文章内容...")
-        analysis_result = llm_analyze.analyze_article(content)
-        title = analysis_result.get('title', title).replace("详解", "")
-        summary = trim_summary(analysis_result.get('summary', title))
-        keywords = analysis_result.get('keywords', [])
-        tags = ','.join(keywords) if keywords else "Solidity"
-        if "Solidity" not in tags:
-            tags = tags + ",Solidity"
-        print(f"分析完成 - title: {title} ")
-        print(f"分析完成 - 关键词: {tags}")
+        with limits.llm_stage() if limits else nullcontext():
+            with metrics.span('analyze', file=filename):
+                analysis_result = llm_analyze.analyze_article(content, on_field=on_field)
+        if analysis_result is None:
+            raise ValueError("没有可用的分析模型")
+        title = prepared.get('title', title)
+        summary = prepared.get('summary', trim_summary(title))
+        tags = prepared.get('tags', "Solidity")
     except Exception as e:
         print(f"⚠️  分析文章失败: {e}，使用默认值")
         summary = title
@@ -142,165 +213,248 @@ def publish_article(filename, force=False):
 
     # print(payload)
 
-    lbc_article_id = post_article(
-        payload                       
-    )
+    with limits.api_stage() if limits else nullcontext():
+        with metrics.span('post', file=filename):
+            # 同一文件的同一内容使用相同的幂等键，重试或下次重新运行都不会重复发布
+            lbc_article_id = post_article(payload, idempotency_key=content_hash(f"{filename}\0{content}"))
 
     if lbc_article_id:
         print(f"{filename} 发布成功，LBC 文章ID: {lbc_article_id}")
         # 记录发布信息
-        save_published_article(filename, lbc_article_id)
+        save_published_article(filename, lbc_article_id, content)
     else:
         print(f"发布文章： {filename} 发布失败")
     return lbc_article_id
         
-def post_article(payload, max_retries=2, retry_delay=5):
+def post_article(payload, max_retries=2, retry_delay=5, idempotency_key=None):
     """
-    发布文章，遇到504错误时自动重试
+    发布文章，遇到 429 / 5xx（如 504）或网络错误时由 LBC 客户端自动重试
+
+    创建文章不是幂等请求：请求带上幂等键，服务端把同一幂等键的重复提交当作同一篇文章；
+    没有幂等键时只在连接未建立或遇到 429 / Retry-After 时重试，以免重复发布。
+    服务端处理长文章可能较慢，读取超时默认不限（LBC_CREATE_READ_TIMEOUT）。
     
     Args:
         payload: 文章数据
-        max_retries: 最大重试次数，默认3次
-        retry_delay: 重试前等待时间（秒），默认5秒
+        max_retries: 最多尝试次数，默认2次
+        retry_delay: 首次重试的基准等待时间（秒），默认5秒
+        idempotency_key: 幂等键，默认由标题和内容计算
     
     Returns:
         lbc_article_id: 成功时返回文章ID，失败时返回None
     """
-    for attempt in range(max_retries):
-        response = requests.post(
-            url=LBC_BASE_API_URL + '/api/post/article',
-            headers={
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'x-api-key': LBC_API_KEY
-            },
-            data = urlencode(payload)
-        )
+    if idempotency_key is None:
+        idempotency_key = content_hash(f"{payload.get('title')}\0{payload.get('content')}")
+    timeout = (LBC_HTTP_TIMEOUT, LBC_CREATE_READ_TIMEOUT or None)
+    response, _, error = get_client().post('/api/post/article', payload, payload.get('link'),
+                                           max_retries=max_retries, retry_delay=retry_delay, timeout=timeout,
+                                           idempotent=False, idempotency_key=idempotency_key)
+    if error:
+        print(f" {payload.get('link')} 发布失败，{error}")
+        return None
 
-        if response.status_code == 200:
-            result = response.json()
-            print(result)
+    if response.status_code == 200:
+        result = response.json()
+        print(result)
 
-            if result.get("code") == 0:
-                print(f" {payload.get('link')} 发布成功")
-                lbc_article_id = result.get("article_id")
-                return lbc_article_id
-            else:
-                print(f" {payload.get('link')} 发布失败, {result.get('code')},   错误信息: {result.get('message')}")
-                return None
-        
-        elif response.status_code == 504:
-            # 504 Gateway Timeout 错误，进行重试
-            if attempt < max_retries - 1:
-                print(f" {payload.get('link')} 遇到504错误，{retry_delay}秒后重试 (第 {attempt + 1}/{max_retries} 次尝试)")
-                time.sleep(retry_delay)
-                continue
-            else:
-                print(f" {payload.get('link')} 发布失败，504错误，已重试 {max_retries} 次，放弃")
-                return None
+        if result.get("code") == 0:
+            print(f" {payload.get('link')} 发布成功")
+            lbc_article_id = result.get("article_id")
+            return lbc_article_id
         else:
-            print(f" {payload.get('link')} 发布失败{response.status_code} {response.text}")
+            print(f" {payload.get('link')} 发布失败, {result.get('code')},   错误信息: {result.get('message')}")
             return None
-    
-    return None
+    else:
+        print(f" {payload.get('link')} 发布失败{response.status_code} {response.text}")
+        return None
+
 
+def update_lbc_article(article_id, new_markdown, max_retries=2, retry_delay=5, timeout=None):
+    """
+    更新 LBC 上的文章内容，更新是幂等的，遇到 429 / 5xx 或网络错误时都会重试
 
-def update_lbc_article(article_id, new_markdown):
+    Returns:
+        dict: {'ok', 'article_id', 'status_code', 'attempts', 'error', 'elapsed'}
+    """
     payload = {
         "article_id": article_id,
         "content": new_markdown
     }
 
-    # print(payload)
-    url = LBC_BASE_API_URL + '/api/article/update'
-
-    response = requests.post(
-        url,
-        headers={
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'x-api-key': LBC_API_KEY
-        },
-        data=urlencode(payload)
-    )
+    started = time.monotonic()
+    response, attempts, error = get_client().post('/api/article/update', payload, f"更新文章 {article_id}",
+                                                  max_retries=max_retries, retry_delay=retry_delay,
+                                                  timeout=timeout)
+    result = {
+        'ok': False,
+        'article_id': article_id,
+        'status_code': response.status_code if response is not None else None,
+        'attempts': attempts,
+        'error': error,
+    }
 
-    
-    if response.status_code == 200:
-        result = response.json()
-        print(result)
-        if result.get("code") == 0:
-            print(f"更新文章 {article_id} 中的链接成功")
+    if error is None:
+        if response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            if data.get("code") == 0:
+                result['ok'] = True
+            else:
+                result['error'] = f"code={data.get('code')} {data.get('message')}"
         else:
-            print(f"更新文章 {article_id} 中的链接失败")
+            result['error'] = f"HTTP {response.status_code} {response.text[:200]}"
+
+    result['elapsed'] = time.monotonic() - started
+    if result['ok']:
+        print(f"更新文章 {article_id} 成功")
     else:
-        print(f"更新文章 {article_id} 中的链接失败")
+        print(f"更新文章 {article_id} 失败: {result['error']}")
+    return result
+
+def publish_one(file_path, force=False, limits=None, migrate_images=True):
+    """发布单个文件，返回 'success'、'skip' 或 'fail'"""
+    try:
+        result = publish_article(str(file_path), force=force, limits=limits,
+                                 migrate_images=migrate_images)
+        if result:
+            return 'success'
+        # 检查是否因为已发布而跳过
+        if is_article_published(str(file_path)):
+            return 'skip'
+        return 'fail'
+    except Exception as e:
+        print(f"❌ 处理文件 {file_path} 时出错: {e}")
+        return 'fail'
+
+
+def publish_batch(files_to_publish, force=False, limits=None, migrate_images=True):
+    """
+    并发发布多个文件
+
+    LLM 分析和 LBC API 请求是两个独立的阶段，分别由 limits 控制并发数，
+    API 请求通过令牌桶限速，代替原来每个文件之间固定的等待。
+    发布前先对所有待发布文章统一迁移外部图片，相同图片只上传一次。
+
+    Returns:
+        (success_count, skip_count, fail_count)
+    """
+    if limits is None:
+        limits = PublishLimits()
+
+    if migrate_images:
+        to_migrate = [f for f in files_to_publish if force or not is_article_published(str(f))]
+        if to_migrate:
+            migrate_article_images(to_migrate)
+
+    counts = {'success': 0, 'skip': 0, 'fail': 0}
+    total = len(files_to_publish)
+    max_workers = max(1, min(total, limits.llm_workers + limits.api_workers))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i, file_path in enumerate(files_to_publish, 1):
+            print(f"[{i}/{total}] 加入发布队列: {file_path}")
+            futures[executor.submit(publish_one, file_path, force, limits, False)] = file_path
+
+        for done, future in enumerate(as_completed(futures), 1):
+            status = future.result()
+            counts[status] += 1
+            print(f"[{done}/{total}] {futures[future]}: {status}")
+
+    return counts['success'], counts['skip'], counts['fail']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='发布 Markdown 文章到 LBC',
+        epilog='示例:\n'
+               '  python publish_article.py ../docs/solidity-adv\n'
+               '  python publish_article.py ../docs/solidity-adv/7_storage_gas.md --force',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('target_path', help='要发布的文件或文件夹路径')
+    parser.add_argument('--force', action='store_true', help='即使已发布过也重新发布')
+    parser.add_argument('--no-migrate-images', action='store_true', help='发布前不迁移文章中的外部图片')
+    parser.add_argument('--llm-workers', type=int, default=4, help='同时进行的 LLM 分析数，默认 4')
+    parser.add_argument('--api-workers', type=int, default=2, help='同时进行的 LBC API 请求数，默认 2')
+    parser.add_argument('--api-rate', type=float, default=1.0,
+                        help='LBC API 每秒最多请求数，默认 1，0 表示不限速')
+    parser.add_argument('--metrics', action='store_true', help='统计读取、分析、发布、重试等待等各环节的耗时')
+    parser.add_argument('--metrics-jsonl', metavar='PATH', help='把各环节的逐条耗时和汇总追加写入 JSON Lines 文件')
+    parser.add_argument('--metrics-prom', metavar='PATH', help='把汇总写入 Prometheus 文本格式文件')
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_jsonl or args.metrics_prom:
+        metrics.enable(keep_events=bool(args.metrics_jsonl))
+
+    target_path = Path(args.target_path)
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("用法: python publish_article.py <文件或文件夹路径> [--force]")
-        sys.exit(1)
-    
-    target_path = Path(sys.argv[1])
-    force = '--force' in sys.argv
-    
     if not target_path.exists():
         print(f"错误: 路径不存在: {target_path}")
-        sys.exit(1)
-    
+        return 1
+
     # 收集要发布的文件
     files_to_publish = []
-    
+
     if target_path.is_file():
         # 如果是单个文件
         if target_path.suffix == '.md':
             files_to_publish = [target_path]
         else:
             print(f"错误: 文件不是 .md 格式: {target_path}")
-            sys.exit(1)
+            return 1
     elif target_path.is_dir():
         # 如果是文件夹，递归查找所有 .md 文件
         files_to_publish = sorted(target_path.rglob('*.md'))
         if not files_to_publish:
             print(f"警告: 在文件夹 {target_path} 中未找到 .md 文件")
-            sys.exit(0)
+            return 0
     else:
         print(f"错误: 无效的路径: {target_path}")
-        sys.exit(1)
-    
+        return 1
+
     # 按文件名排序
     files_to_publish = sorted(files_to_publish)
-    
-    print(f"找到 {len(files_to_publish)} 个文件，开始依次发布...")
+
+    limits = PublishLimits(llm_workers=max(1, args.llm_workers),
+                           api_workers=max(1, args.api_workers),
+                           api_rate=args.api_rate)
+
+    print(f"找到 {len(files_to_publish)} 个文件，开始发布 "
+          f"(LLM 并发 {limits.llm_workers}，API 并发 {limits.api_workers}，API 限速 {args.api_rate}/秒)...")
     print("=" * 60)
-    
-    success_count = 0
-    skip_count = 0
-    fail_count = 0
-    
-    for i, file_path in enumerate(files_to_publish, 1):
-        print(f"\n[{i}/{len(files_to_publish)}] 处理文件: {file_path}")
-        print("-" * 60)
-        
-        try:
-            result = publish_article(str(file_path), force=force)
-            if result:
-                success_count += 1
-            else:
-                # 检查是否因为已发布而跳过
-                if is_article_published(str(file_path)):
-                    skip_count += 1
-                else:
-                    fail_count += 1
-        except Exception as e:
-            print(f"❌ 处理文件 {file_path} 时出错: {e}")
-            fail_count += 1
-            continue
-        
-        # 在文件之间添加短暂延迟，避免请求过快
-        if i < len(files_to_publish):
-            time.sleep(1)
-    
+
+    success_count, skip_count, fail_count = publish_batch(files_to_publish, force=args.force, limits=limits,
+                                                          migrate_images=not args.no_migrate_images)
+
+    # 把本次追加的发布日志合并回 published_articles.json
+    get_store(PUBLISHED_ARTICLES_FILE).compact()
+
     print("\n" + "=" * 60)
     print("发布完成！")
     print(f"  成功: {success_count} 个")
     print(f"  跳过: {skip_count} 个")
     print(f"  失败: {fail_count} 个")
     print(f"  总计: {len(files_to_publish)} 个")
+    llm_stats = llm_cache.get_cache().stats()
+    print(f"  LLM 分析缓存: 命中 {llm_stats['hits']} 次，未命中 {llm_stats['misses']} 次")
+    conn_stats = llm_analyze.connection_stats.snapshot()
+    print(f"  LLM 连接: 请求 {conn_stats['requests']} 次，新建连接 {conn_stats['new_connections']} 个，"
+          f"复用连接 {conn_stats['reused_connections']} 次")
+    print(f"  LBC API: {format_metrics(get_client().metrics.snapshot())}")
+
+    if metrics.is_enabled():
+        print(metrics.format_summary())
+        if args.metrics_jsonl:
+            metrics.write_jsonl(args.metrics_jsonl)
+            print(f"  耗时明细已写入 {args.metrics_jsonl}")
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+            print(f"  Prometheus 指标已写入 {args.metrics_prom}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已发布文章记录存储
+
+记录由两部分组成：
+- published_articles.json：压缩后的完整快照，格式保持不变 {文件路径: {lbc_article_id, published_at, ...}}
+- published_articles.json.log：追加写入的增量日志，每行一条 JSON 记录
+
+每次保存只追加一行日志，不再重写整个 JSON 文件；日志超过一定条数后合并回快照，
+通过 get_store 获取的存储在进程退出时也会把本进程追加的日志合并回快照。
+读写都通过文件锁保护，多个进程同时发布也不会丢失记录。进程内缓存所有记录，
+查询为 O(1)，文件被其他进程修改时只增量读取新追加的日志。
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只保证进程内的并发安全
+    fcntl = None
+
+PUBLISHED_ARTICLES_FILE = Path(__file__).parent / "published_articles.json"
+
+COMPACT_THRESHOLD = 50  # 日志超过这么多条时合并回快照
+
+
+class _FileLock:
+    """基于 flock 的跨进程文件锁"""
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return None
+
+
+class PublishedStore:
+    """已发布文章记录：快照 + 追加日志，带进程内缓存"""
+
+    def __init__(self, snapshot_path=PUBLISHED_ARTICLES_FILE):
+        self.snapshot_path = Path(snapshot_path)
+        self.log_path = self.snapshot_path.with_name(self.snapshot_path.name + '.log')
+        self.lock_path = self.snapshot_path.with_name(self.snapshot_path.name + '.lock')
+        self._records = {}
+        self._snapshot_signature = None
+        self._log_offset = 0
+        self._log_entries = 0
+        self._loaded = False
+        self._appended = False  # 本进程是否追加过日志
+        self._lock = threading.RLock()
+
+    # ---- 读取 ----
+
+    def _refresh(self):
+        """文件被修改时刷新缓存：快照变化则全部重新加载，日志增长则只读取新追加的部分"""
+        log_signature = _file_signature(self.log_path)
+        if (self._loaded and _file_signature(self.snapshot_path) == self._snapshot_signature
+                and (log_signature[1] if log_signature else 0) == self._log_offset):
+            return
+        with _FileLock(self.lock_path, shared=True):
+            self._reload()
+
+    def _reload(self):
+        """重新读取文件（调用方需持有文件锁）"""
+        snapshot_signature = _file_signature(self.snapshot_path)
+        log_signature = _file_signature(self.log_path)
+        log_size = log_signature[1] if log_signature else 0
+        if (not self._loaded or snapshot_signature != self._snapshot_signature
+                or log_size < self._log_offset):
+            self._records = self._read_snapshot()
+            self._snapshot_signature = snapshot_signature
+            self._log_offset = 0
+            self._log_entries = 0
+        self._read_log()
+        self._loaded = True
+
+    def _read_snapshot(self):
+        if not self.snapshot_path.exists():
+            return {}
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取发布记录文件时出错: {e}")
+            return {}
+
+    def _read_log(self):
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+
+        # 只处理完整的行
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"跳过损坏的发布日志记录: {e}")
+                continue
+            self._apply(entry)
+            self._log_entries += 1
+        self._log_offset += end
+
+    def _apply(self, entry):
+        key = entry['key']
+        if entry.get('value') is None:
+            self._records.pop(key, None)
+        else:
+            self._records[key] = entry['value']
+
+    def get(self, filename):
+        """获取文章的发布信息，未发布时返回 None"""
+        with self._lock:
+            self._refresh()
+            info = self._records.get(filename)
+            return dict(info) if info is not None else None
+
+    def contains(self, filename):
+        with self._lock:
+            self._refresh()
+            return filename in self._records
+
+    def all(self):
+        """返回所有发布记录的副本"""
+        with self._lock:
+            self._refresh()
+            return {key: dict(value) for key, value in self._records.items()}
+
+    # ---- 写入 ----
+
+    def put(self, filename, info):
+        """保存（覆盖）一篇文章的发布信息"""
+        self._append({'key': filename, 'value': info})
+
+    def update(self, filename, **fields):
+        """合并更新一篇文章的发布信息，文章不存在时返回 False"""
+        with self._lock, _FileLock(self.lock_path):
+            self._reload()
+            info = self._records.get(filename)
+            if info is None:
+                return False
+            info = dict(info, **fields)
+            self._write_log_entry({'key': filename, 'value': info})
+            return True
+
+    def remove(self, filename):
+        self._append({'key': filename, 'value': None})
+
+    def _append(self, entry):
+        with self._lock, _FileLock(self.lock_path):
+            self._reload()
+            self._write_log_entry(entry)
+
+    def _write_log_entry(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._apply(entry)
+        self._log_offset += len(line)
+        self._log_entries += 1
+        self._appended = True
+
+        if self._log_entries >= COMPACT_THRESHOLD:
+            self._compact_locked()
+
+    def compact(self):
+        """把日志合并回快照文件，使 published_articles.json 包含全部记录"""
+        with self._lock, _FileLock(self.lock_path):
+            self._reload()
+            if self._log_entries:
+                self._compact_locked()
+
+    def _compact_locked(self):
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._records, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        # 快照已包含全部记录，删除日志
+        os.unlink(self.log_path)
+        self._snapshot_signature = _file_signature(self.snapshot_path)
+        self._log_offset = 0
+        self._log_entries = 0
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(snapshot_path=PUBLISHED_ARTICLES_FILE):
+    """获取进程内共用的存储实例"""
+    key = str(Path(snapshot_path).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = PublishedStore(snapshot_path)
+        return store
+
+
+def _compact_on_exit():
+    """进程退出时合并本进程追加过日志的存储，publish_article() 等库函数的调用方无需自行 compact"""
+    for store in list(_stores.values()):
+        if not store._appended or not store.snapshot_path.parent.exists():
+            continue
+        try:
+            store.compact()
+        except OSError as e:
+            print(f"⚠️  合并发布记录日志失败: {e}")
+
+
+atexit.register(_compact_on_exit)
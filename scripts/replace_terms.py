@@ -4,11 +4,18 @@
 import re
 import traceback
 import argparse
+import os
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+from content_cache import CACHE_DIR, ContentHashCache, mapping_hash
+
 MAX_LINKS_PER_TERM = 2  # 每个术语在同一文档中最多出现2次链接
 MAX_LINKS_PER_FILE = 6  # 每个文件最多添加6个链接
 
+DEFAULT_TERMLINK_PATH = '/Users/emmett/blockdocs/web3map/scripts/termlink.md'
+
 
 def extract_terms_and_links(termlink_path):
     """从 termlink.md 文件中提取术语和对应的链接"""
@@ -34,112 +41,185 @@ def extract_terms_and_links(termlink_path):
     return terms_dict
 
 
-def is_in_code_block(text, pos):
-    """检查位置是否在代码块中"""
-    before_text = text[:pos]
-    # 计算三个反引号的数量
-    triple_backticks = before_text.count('```')
-    # 如果数量为奇数，说明在代码块中
-    return triple_backticks % 2 == 1
-
-
-def is_in_inline_code(text, pos):
-    """检查位置是否在行内代码中"""
-    # 向前查找最近的单个反引号
-    start = text.rfind('`', 0, pos)
-    if start == -1:
-        return False
-
-    # 检查这个反引号是否是三个反引号的一部分
-    if start >= 2 and text[start-2:start+1] == '```':
-        return False
-    if start >= 1 and text[start-1:start+2] == '```':
-        return False
-    if start <= len(text) - 3 and text[start:start+3] == '```':
-        return False
-
-    # 向后查找配对的反引号
-    end = text.find('`', pos)
-    if end == -1:
-        return False
-
-    # 检查配对的反引号是否是三个反引号的一部分
-    if end >= 2 and text[end-2:end+1] == '```':
-        return False
-    if end >= 1 and text[end-1:end+2] == '```':
-        return False
-    if end <= len(text) - 3 and text[end:end+3] == '```':
-        return False
-
-    return True
-
-
-def is_in_link(text, pos, term_len):
-    """检查术语是否在链接中（包括链接文本部分和URL部分）"""
-    # 向前查找，看是否在 [...] 中
-    before = text[:pos]
-    # 查找最近的 [ 和 ]
-    last_bracket_open = before.rfind('[')
-    last_bracket_close = before.rfind(']')
+def is_word_char(ch):
+    """与正则 \\w 一致的单词字符判断（包含中文等 Unicode 字母数字）"""
+    return ch.isalnum() or ch == '_'
 
-    # 如果在 [...] 中
-    if last_bracket_open != -1 and (last_bracket_close == -1 or last_bracket_open > last_bracket_close):
-        return True
 
-    # 向前查找，看是否在 (...) 中的URL部分
-    last_paren_open = before.rfind('(')
-    last_paren_close = before.rfind(')')
-
-    # 如果在 (...) 中，且前面紧挨着 ]
-    if last_paren_open != -1 and (last_paren_close == -1 or last_paren_open > last_paren_close):
-        # 检查 ( 前面是否是 ]
-        if last_paren_open > 0 and text[last_paren_open-1] == ']':
-            return True
-
-    return False
+def has_word_boundary(before, after):
+    """检查两个相邻字符之间是否为单词边界，等价于正则中的 \\b（文档首尾传入空字符串）"""
+    return is_word_char(before) != is_word_char(after)
 
 
-def is_in_url(text, pos):
-    """检查是否在URL中"""
-    # 向前查找，看是否在 http:// 或 https:// 之后
-    before = text[:pos]
-    # 查找最近的空格或行首
-    last_space = max(before.rfind(' '), before.rfind('\n'), before.rfind('\t'))
-    if last_space != -1:
-        word = before[last_space+1:]
-        if word.startswith('http://') or word.startswith('https://'):
-            return True
-    else:
-        # 从行首开始
-        if before.startswith('http://') or before.startswith('https://'):
-            return True
-    return False
+class TermMatcher:
+    """基于 Aho-Corasick 自动机的多术语匹配器，一次扫描即可找出所有术语的出现位置"""
 
+    def __init__(self, term_links):
+        # entries 保持 term_links 的顺序，术语的处理顺序决定了链接的优先级
+        self.entries = []  # [(术语, 链接, 是否需要单词边界)]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
 
-def is_in_heading(text, pos):
-    """检查位置是否在标题行中（以 ## 或 ### 等开头的行）"""
-    # 找到当前位置所在行的开始位置
-    line_start = text.rfind('\n', 0, pos)
-    if line_start == -1:
-        line_start = 0
-    else:
-        line_start += 1  # 跳过换行符
-
-    # 获取从行首到当前位置之间的内容
-    line_prefix = text[line_start:pos]
-
-    # 获取整行内容用于检查
-    line_end = text.find('\n', pos)
-    if line_end == -1:
-        line_end = len(text)
-    line = text[line_start:line_end]
-
-    # 检查行是否以 ## 开头（markdown 标题）
-    stripped_line = line.lstrip()
-    if stripped_line.startswith('#'):
-        return True
+        for term, link in term_links.items():
+            # 空术语无法构成有效链接
+            if not term:
+                continue
+            # 包含英文字母的术语需要满足单词边界，纯中文等直接匹配
+            needs_boundary = bool(re.search(r'[a-zA-Z]', term))
+            self._add_term(term, len(self.entries))
+            self.entries.append((term, link, needs_boundary))
+
+        self._build_fail_links()
+
+    def _add_term(self, term, index):
+        """将术语插入字典树"""
+        state = 0
+        for ch in term:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_fail_links(self):
+        """按广度优先顺序构建失败指针，并合并后缀状态的输出"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """扫描一次文本，返回每个术语（与 entries 对应）的所有起始位置，按位置升序排列"""
+        occurrences = [[] for _ in self.entries]
+        lengths = [len(term) for term, _, _ in self.entries]
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                occurrences[index].append(i + 1 - lengths[index])
+
+        return occurrences
+
+
+class MarkdownRegions:
+    """文档中不应添加术语链接的区域索引
+
+    一次扫描文档，将代码块、行内代码、链接文本、链接 URL、裸 URL 和标题行
+    整理为有序且互不重叠的区间，之后每个位置的检查只需一次二分查找。
+    同时记录换行符位置，用于快速计算行号。
+    """
+
+    ALL_KINDS = ('code_block', 'inline_code', 'link', 'url', 'heading')
+    CODE_KINDS = ('code_block', 'inline_code')
+
+    def __init__(self, text, kinds=ALL_KINDS):
+        """kinds 指定需要排除的区域类型，默认包括全部类型"""
+        self._newlines = [m.start() for m in re.finditer('\n', text)]
+
+        # 区间均为左闭右开，end 可能为 len(text) + 1，表示一直延续到文档末尾
+        intervals = []
+        for kind in kinds:
+            intervals.extend(getattr(self, f'_{kind}_regions')(text))
+
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            if start >= end:
+                continue
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @staticmethod
+    def _code_block_regions(text):
+        """代码块：位置之前的 ``` 数量为奇数"""
+        fence_ends = [m.end() for m in re.finditer('```', text)]
+        regions = []
+        for i in range(0, len(fence_ends), 2):
+            end = fence_ends[i + 1] if i + 1 < len(fence_ends) else len(text) + 1
+            regions.append((fence_ends[i], end))
+        return regions
+
+    @staticmethod
+    def _inline_code_regions(text):
+        """行内代码：前后最近的反引号都不属于 ``` """
+        ticks = []  # (位置, 是否为单独的反引号)
+        for m in re.finditer('`+', text):
+            single = m.end() - m.start() < 3
+            ticks.extend((i, single) for i in range(m.start(), m.end()))
+
+        regions = []
+        for (start, start_single), (end, end_single) in zip(ticks, ticks[1:]):
+            if start_single and end_single:
+                regions.append((start + 1, end + 1))
+        return regions
+
+    @staticmethod
+    def _link_regions(text):
+        """链接文本 [...] 以及紧跟在 ] 之后的链接 URL (...)"""
+        regions = []
+
+        brackets = [(m.start(), m.group()) for m in re.finditer(r'[\[\]]', text)]
+        for i, (pos, ch) in enumerate(brackets):
+            if ch == '[':
+                end = brackets[i + 1][0] + 1 if i + 1 < len(brackets) else len(text) + 1
+                regions.append((pos + 1, end))
+
+        parens = [(m.start(), m.group()) for m in re.finditer(r'[()]', text)]
+        for i, (pos, ch) in enumerate(parens):
+            if ch == '(' and pos > 0 and text[pos - 1] == ']':
+                end = parens[i + 1][0] + 1 if i + 1 < len(parens) else len(text) + 1
+                regions.append((pos + 1, end))
+
+        return regions
+
+    @staticmethod
+    def _url_regions(text):
+        """以 http:// 或 https:// 开头的单词（以空格、换行、制表符分隔）"""
+        regions = []
+        for m in re.finditer(r'(?:^|(?<=[ \n\t]))https?://', text):
+            word_end = re.compile(r'[ \n\t]').search(text, m.start())
+            end = word_end.start() + 1 if word_end else len(text) + 1
+            regions.append((m.end(), end))
+        return regions
+
+    @staticmethod
+    def _heading_regions(text):
+        """标题行：去掉行首空白后以 # 开头的整行（含行尾换行符位置）"""
+        regions = []
+        for m in re.finditer(r'^[^\S\n]*#', text, re.MULTILINE):
+            line_end = text.find('\n', m.start())
+            end = line_end + 1 if line_end != -1 else len(text) + 1
+            regions.append((m.start(), end))
+        return regions
+
+    def is_excluded(self, pos):
+        """检查位置是否位于不应添加链接的区域中"""
+        i = bisect_right(self._starts, pos) - 1
+        return i >= 0 and pos < self._ends[i]
+
+    def line_number(self, pos):
+        """返回位置所在的行号（从 0 开始）"""
+        return bisect_left(self._newlines, pos)
 
-    return False
 
 def remove_all_term_links(content, term_links):
     """移除所有术语链接，还原为纯文本"""
@@ -154,40 +234,77 @@ def remove_all_term_links(content, term_links):
 
 
 
-def add_links_to_content(content, term_links):
-    """为内容添加术语链接，每个术语最多替换2次，同一行只替换一次"""
+def mirror_eip_links(content):
+    """替换 EIP 链接为登链社区的镜像链接"""
+    if "https://eips.ethereum.org/" in content:
+        content = content.replace(
+            "https://eips.ethereum.org/EIPS/eip-",
+            "https://learnblockchain.cn/docs/eips/EIPS/eip-"
+        )
+        content = content.replace(
+            "https://eips.ethereum.org/erc",
+            "https://learnblockchain.cn/docs/eips/erc/"
+        )
+    return content
+
+
+def add_links_to_content(content, term_links, matcher=None, regions=None):
+    """为内容添加术语链接，每个术语最多替换2次，同一行只替换一次
+
+    matcher 为由 term_links 构建的 TermMatcher，批量处理文件时应预先构建并复用；
+    regions 为 content 的 MarkdownRegions，已经建立过索引时可直接传入
+    """
     # 检查 https://learnblockchain.cn/tags 出现的次数
     tag_link_count = content.count('https://learnblockchain.cn/tags')
     if tag_link_count >= 4:
         # 如果出现超过 4 次，跳过替换逻辑，直接返回原内容
         return content
 
-    # 直接在原内容基础上添加术语链接
-    result = content
+    if matcher is None:
+        matcher = TermMatcher(term_links)
+
+    # 一次扫描原文，找出所有术语的出现位置，并建立不可链接区域的索引
+    occurrences = matcher.find_all(content)
+    if regions is None:
+        regions = MarkdownRegions(content)
+
+    # 所有替换都记录为针对原文的编辑，最后一次性拼接生成结果
+    edits = {}  # 原文起始位置 -> (原文结束位置, 替换文本)
+    edit_starts = []  # 已接受编辑的起始位置（有序），用于检查重叠
+    edit_ends = set()
     total_replacements = 0
 
-    for term, link in term_links.items():
+    for index, (term, link, needs_boundary) in enumerate(matcher.entries):
         link_count = 0  # 当前术语已添加的链接数
         replaced_lines = set()  # 记录已经替换过该术语的行号
         markdown_link = f'[{term}]({link})'
-
-        # 使用正则表达式查找所有匹配的术语
-        # 使用单词边界 \b 确保只替换完整的词，而不是词的一部分
-        # 对于包含特殊字符的术语(如 web3.js)，需要特殊处理
-        if re.search(r'[a-zA-Z]', term):
-            # 如果术语包含英文字母，使用单词边界
-            pattern = re.compile(r'\b' + re.escape(term) + r'\b')
-        else:
-            # 对于纯中文或其他字符，直接匹配
-            pattern = re.compile(re.escape(term))
-        matches = list(pattern.finditer(result))
-
-        # 从后向前替换，避免位置偏移问题
-        for match in reversed(matches):
-            pos = match.start()
-
+        term_len = len(term)
+
+        # 筛选出与逐个术语 finditer 一致的匹配：已被链接覆盖的位置不再匹配，
+        # 单词边界按已插入链接后的文本判断（链接的 [ 和 ) 会产生新的边界），
+        # 同一术语的匹配互不重叠
+        matches = []
+        last_end = 0
+        for start in occurrences[index]:
+            end = start + term_len
+            if start < last_end:
+                continue
+            i = bisect_left(edit_starts, end) - 1
+            if i >= 0 and edits[edit_starts[i]][0] > start:
+                continue
+            if needs_boundary:
+                # 已插入链接的 ) 和 [ 会成为术语两侧的相邻字符
+                before = ')' if start in edit_ends else content[start - 1:start]
+                after = '[' if end in edits else content[end:end + 1]
+                if not (has_word_boundary(before, term[0]) and has_word_boundary(term[-1], after)):
+                    continue
+            matches.append(start)
+            last_end = end
+
+        # 从后向前选择，与原先从后向前替换的顺序一致
+        for start in reversed(matches):
             # 计算当前匹配所在的行号
-            line_number = result[:pos].count('\n')
+            line_number = regions.line_number(start)
 
             # 检查是否达到文件总替换次数限制
             if total_replacements >= MAX_LINKS_PER_FILE:
@@ -200,16 +317,14 @@ def add_links_to_content(content, term_links):
             if line_number in replaced_lines:
                 continue
 
-            # 检查是否应该跳过这个匹配
-            if (is_in_code_block(result, pos) or
-                is_in_inline_code(result, pos) or
-                is_in_link(result, pos, len(term)) or
-                is_in_url(result, pos) or
-                is_in_heading(result, pos)):
+            # 检查是否应该跳过这个匹配（代码、链接、URL、标题中的术语不添加链接）
+            if regions.is_excluded(start):
                 continue
 
-            # 替换为链接
-            result = result[:pos] + markdown_link + result[pos + len(term):]
+            # 记录替换为链接
+            edits[start] = (start + term_len, markdown_link)
+            insort(edit_starts, start)
+            edit_ends.add(start + term_len)
             link_count += 1
             replaced_lines.add(line_number)
             total_replacements += 1
@@ -217,10 +332,22 @@ def add_links_to_content(content, term_links):
         # 如果已经达到文件总替换次数限制，停止处理其他术语
         if total_replacements >= MAX_LINKS_PER_FILE:
             break
-    return result
+
+    if not edits:
+        return content
+
+    pieces = []
+    last = 0
+    for start in edit_starts:
+        end, replacement = edits[start]
+        pieces.append(content[last:start])
+        pieces.append(replacement)
+        last = end
+    pieces.append(content[last:])
+    return ''.join(pieces)
 
 
-def replace_terms_in_file(file_path, terms_dict):
+def replace_terms_in_file(file_path, terms_dict, matcher=None):
     """在文件中替换术语为对应的超链接"""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -228,18 +355,10 @@ def replace_terms_in_file(file_path, terms_dict):
 
         # 替换 EIP 链接为登链社区的镜像链接
         original_content = content
-        if "https://eips.ethereum.org/" in content:
-            content = content.replace(
-                "https://eips.ethereum.org/EIPS/eip-",
-                "https://learnblockchain.cn/docs/eips/EIPS/eip-"
-            )
-            content = content.replace(
-                "https://eips.ethereum.org/erc",
-                "https://learnblockchain.cn/docs/eips/erc/"
-            )
+        content = mirror_eip_links(content)
 
         # 使用改进的链接添加函数
-        new_content = add_links_to_content(content, terms_dict)
+        new_content = add_links_to_content(content, terms_dict, matcher)
 
         # 如果内容有变化，写回文件
         if new_content != original_content:
@@ -254,38 +373,102 @@ def replace_terms_in_file(file_path, terms_dict):
         raise
 
 
-def process_directory(directory, terms_dict):
-    """处理目录下的所有 markdown 文件"""
+# 并行模式下工作进程持有的术语字典和匹配自动机，进程池启动时每个进程只接收一次
+_worker_state = None
+
+
+def _init_worker(terms_dict, matcher):
+    """进程池初始化：保存术语数据，避免每个任务都重新传递"""
+    global _worker_state
+    _worker_state = (terms_dict, matcher)
+
+
+def _replace_terms_in_worker(file_path):
+    """在工作进程中处理单个文件"""
+    terms_dict, matcher = _worker_state
+    return replace_terms_in_file(file_path, terms_dict, matcher)
+
+
+def process_directory(directory, terms_dict, jobs=1, cache=None):
+    """处理目录下的所有 markdown 文件
+
+    jobs 大于 1 时使用多进程并行处理，各文件之间互不影响
+    cache 为 ContentHashCache 时，跳过在当前术语字典下已处理过且未变化的文件
+    """
     updated_count = 0
     skipped_count = 0
     total_count = 0
 
+    # 术语匹配自动机只构建一次，所有文件共用
+    matcher = TermMatcher(terms_dict)
+
     try:
         # 递归获取所有 .md 文件
-        for file_path in Path(directory).rglob('*.md'):
-            total_count += 1
-            try:
-                if replace_terms_in_file(file_path, terms_dict):
-                    updated_count += 1
-                    print(f"✓ 已更新: {file_path}")
-                else:
-                    skipped_count += 1
-            except Exception as e:
-                print(f"✗ 错误 {file_path}: {e}")
+        file_paths = list(Path(directory).rglob('*.md'))
+        total_count = len(file_paths)
+
+        if cache is not None:
+            file_paths = [file_path for file_path in file_paths if not cache.is_fresh(file_path)]
+            skipped_count += total_count - len(file_paths)
+
+        if jobs > 1 and len(file_paths) > 1:
+            results = _process_files_parallel(file_paths, terms_dict, matcher, jobs)
+        else:
+            results = _process_files_serial(file_paths, terms_dict, matcher)
+
+        for file_path, updated, error in results:
+            if error is not None:
+                print(f"✗ 错误 {file_path}: {error}")
                 skipped_count += 1
-                continue
+            elif updated:
+                updated_count += 1
+                print(f"✓ 已更新: {file_path}")
+            else:
+                skipped_count += 1
+                # 只缓存处理后没有变化的文件：已更新的文件再次处理时仍可能添加新的链接
+                if cache is not None:
+                    cache.record(file_path)
 
     except Exception as e:
         print(f"Error in process_directory at line {traceback.extract_tb(e.__traceback__)[-1].lineno}:")
         print(traceback.format_exc())
         raise
+    finally:
+        if cache is not None:
+            cache.save()
 
     print(f'\n处理完成！')
     print(f'  更新: {updated_count} 个文件')
     print(f'  跳过: {skipped_count} 个文件')
+    if cache is not None:
+        print(f'  缓存命中: {cache.hits} 个文件')
     print(f'  总计: {total_count} 个文件')
 
 
+def _process_files_serial(file_paths, terms_dict, matcher):
+    """依次处理文件，逐个返回 (文件路径, 是否更新, 错误)"""
+    for file_path in file_paths:
+        try:
+            yield file_path, replace_terms_in_file(file_path, terms_dict, matcher), None
+        except Exception as e:
+            yield file_path, False, e
+
+
+def _process_files_parallel(file_paths, terms_dict, matcher, jobs):
+    """使用进程池并行处理文件，按完成顺序逐个返回 (文件路径, 是否更新, 错误)"""
+    with ProcessPoolExecutor(max_workers=jobs,
+                             initializer=_init_worker,
+                             initargs=(terms_dict, matcher)) as executor:
+        futures = {executor.submit(_replace_terms_in_worker, file_path): file_path
+                   for file_path in file_paths}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                yield file_path, future.result(), None
+            except Exception as e:
+                yield file_path, False, e
+
+
 def main():
     try:
         # 设置命令行参数
@@ -296,6 +479,8 @@ def main():
 示例:
   python replace_terms.py  docs                            # 默认处理 docs 目录
   python replace_terms.py bitcoin/协议/BOLT11.md      # 处理单个文件
+  python replace_terms.py docs --jobs 8                    # 使用 8 个进程并行处理目录
+  python replace_terms.py docs --no-cache                  # 忽略缓存，重新处理所有文件
             '''
         )
         parser.add_argument(
@@ -304,12 +489,23 @@ def main():
             default='solana',
             help='要处理的目标路径（目录或文件，相对于项目根目录），默认为 solana'
         )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=int,
+            default=1,
+            help='并行处理目录时使用的进程数，默认为 1（串行），0 表示使用全部 CPU 核心'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='不使用内容哈希缓存，重新处理所有文件'
+        )
 
         args = parser.parse_args()
 
         # 设置路径
         script_dir = Path(__file__).parent
-        termlink_path = '/Users/emmett/blockdocs/web3map/scripts/termlink.md'
+        termlink_path = DEFAULT_TERMLINK_PATH
         target_path = script_dir.parent / args.target_path
 
         # 提取术语和链接
@@ -334,7 +530,15 @@ def main():
         else:
             # 处理目录
             print(f"目标目录: {target_path}\n")
-            process_directory(target_path, terms_dict)
+            jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+            cache = None
+            if not args.no_cache:
+                # 术语字典或链接数量限制变化时，缓存记录自动失效
+                cache = ContentHashCache(
+                    CACHE_DIR / 'replace_terms_manifest.json',
+                    mapping_hash(terms_dict, MAX_LINKS_PER_TERM, MAX_LINKS_PER_FILE)
+                )
+            process_directory(target_path, terms_dict, jobs, cache)
 
     except Exception as e:
         print(f"Error in main at line {traceback.extract_tb(e.__traceback__)[-1].lineno}:")
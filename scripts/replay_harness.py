@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量发布的离线压测
+
+启动本地模拟服务（lbc_stub_server.py），把 LBC API 和 LLM API 都指向它，
+然后用 publish_article.publish_batch 并发发布一批文章，输出端到端的 文章/分钟 以及各环节统计。
+发布记录和 LLM 分析缓存写入临时目录，不会影响 published_articles.json 和 .cache 中的数据。
+
+文章可以是合成文章（按 --articles / --doc-size 生成），也可以是真实的 docs 目录（--real）；
+LLM 和 LBC 的响应可以是模拟结果，也可以是之前录制的结果（--cassette）。
+注意：--record 会把请求转发到真实服务，真实发布文章，只应在测试账号下使用。
+
+用法:
+  python replay_harness.py --articles 50 --llm-latency 2 --timeout-rate 0.05
+  python replay_harness.py --real --llm-workers 8 --api-workers 4 --api-rate 0 -q
+  python replay_harness.py --real --cassette llm.jsonl -o harness.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import metrics
+from lbc_stub_server import add_server_arguments, format_server_stats, server_options, start_stub_server
+
+DOCS_DIR = Path(__file__).resolve().parent.parent / "docs"
+
+
+def prepare_articles(args, workdir):
+    """返回要发布的文章路径列表"""
+    if args.real:
+        files = sorted(DOCS_DIR.rglob('*.md'))
+        return files[:args.articles] if args.articles else files
+
+    from bench_markdown import generate_corpus
+
+    paths, _ = generate_corpus(workdir / "corpus", docs=args.articles or 50, terms=100,
+                               doc_size=args.doc_size, seed=args.seed)
+    return paths
+
+
+def configure_environment(server, workdir, record=False):
+    """让发布流程使用模拟服务、临时的发布记录和 LLM 缓存，需在导入 publish_article 之前调用
+
+    录制时保留 .env 中真实的 API key，由模拟服务原样转发给上游
+    """
+    os.environ['LBC_BASE_API_URL'] = server.base_url
+    for provider in ('OPENROUTER', 'OPENAI'):
+        os.environ[f'{provider}_BASE_URL'] = server.base_url + '/v1'
+    if not record:
+        for name in ('LBC_API_KEY', 'OPENROUTER_API_KEY', 'OPENAI_API_KEY'):
+            os.environ[name] = 'stub'
+
+    import llm_cache
+    import publish_article
+
+    publish_article.PUBLISHED_ARTICLES_FILE = workdir / "published_articles.json"
+    llm_cache._cache = llm_cache.AnalysisCache(workdir / "llm_analysis.sqlite3")
+    return publish_article
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='replay-harness-') as workdir:
+        workdir = Path(workdir)
+        server = start_stub_server(**server_options(args))
+        publish_article = configure_environment(server, workdir, args.record)
+
+        import llm_analyze
+        from lbc_client import format_metrics, get_client
+
+        files = prepare_articles(args, workdir)
+        limits = publish_article.PublishLimits(llm_workers=max(1, args.llm_workers),
+                                               api_workers=max(1, args.api_workers),
+                                               api_rate=args.api_rate)
+        print(f"模拟服务: {server.base_url}，发布 {len(files)} 篇文章 "
+              f"(LLM 并发 {limits.llm_workers}，API 并发 {limits.api_workers}，API 限速 {args.api_rate}/秒)...")
+
+        metrics.enable()
+        output = io.StringIO() if args.quiet else None
+        started = time.monotonic()
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            success, skip, fail = publish_article.publish_batch(files, force=True, limits=limits,
+                                                                migrate_images=False)
+        elapsed = time.monotonic() - started
+        server.shutdown()
+
+        lbc_metrics = get_client().metrics.snapshot()
+        llm_connections = llm_analyze.connection_stats.snapshot()
+        report = {
+            'articles': len(files),
+            'success': success,
+            'skip': skip,
+            'fail': fail,
+            'seconds': elapsed,
+            'articles_per_minute': success * 60 / elapsed if elapsed else 0.0,
+            'params': {key: getattr(args, key) for key in
+                       ('real', 'llm_workers', 'api_workers', 'api_rate', 'latency', 'llm_latency',
+                        'error_rate', 'timeout_rate', 'timeout_delay', 'throttle_rate', 'cassette')},
+            'lbc': lbc_metrics,
+            'llm_connections': llm_connections,
+            'server': dict(server.stats),
+            'metrics': metrics.get_metrics().summary(),
+        }
+
+    print("=" * 60)
+    print(f"发布 {len(files)} 篇文章：成功 {success}，跳过 {skip}，失败 {fail}，耗时 {elapsed:.1f} 秒，"
+          f"吞吐 {report['articles_per_minute']:.1f} 篇/分钟")
+    print(f"  LBC API: {format_metrics(lbc_metrics)}")
+    print(f"  LLM 连接: 请求 {llm_connections['requests']} 次，新建连接 {llm_connections['new_connections']} 个")
+    print(f"  服务端: {format_server_stats(report['server'])}")
+    print(metrics.format_summary(report['metrics']))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用本地模拟服务对批量发布做端到端压测')
+    parser.add_argument('--real', action='store_true', help='发布 docs 目录中的真实文章（不会修改文件）')
+    parser.add_argument('--articles', type=int, help='文章数：合成文章默认 50，--real 时默认全部')
+    parser.add_argument('--doc-size', type=int, default=8000, help='合成文章的字节数，默认 8000')
+    parser.add_argument('--seed', type=int, default=0, help='生成合成文章的随机种子，默认 0')
+    parser.add_argument('--llm-workers', type=int, default=4, help='同时进行的 LLM 分析数，默认 4')
+    parser.add_argument('--api-workers', type=int, default=2, help='同时进行的 LBC API 请求数，默认 2')
+    parser.add_argument('--api-rate', type=float, default=1.0, help='LBC API 每秒最多请求数，默认 1，0 表示不限速')
+    add_server_arguments(parser)
+    parser.add_argument('-q', '--quiet', action='store_true', help='不输出发布过程中的日志')
+    parser.add_argument('-o', '--output', help='把结果保存为 JSON 文件')
+    args = parser.parse_args()
+
+    try:
+        report = run(args)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    return 0 if report['fail'] == 0 else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -3,43 +3,86 @@
 
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
+
+from content_cache import content_hash
+from lbc_client import format_metrics, get_client
 from publish_article import update_lbc_article, PUBLISHED_ARTICLES_FILE
+from published_store import get_store
 
 
 def load_published_articles():
     """加载已发布文章记录"""
-    if not PUBLISHED_ARTICLES_FILE.exists():
+    if not PUBLISHED_ARTICLES_FILE.exists() and not get_store(PUBLISHED_ARTICLES_FILE).log_path.exists():
         print(f"✗ 发布记录文件不存在: {PUBLISHED_ARTICLES_FILE}")
         return {}
 
-    try:
-        with open(PUBLISHED_ARTICLES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"✗ 读取发布记录文件时出错: {e}")
-        return {}
-
-
-def update_articles(article_files):
+    return get_store(PUBLISHED_ARTICLES_FILE).all()
+
+
+def push_article(job):
+    """推送单篇文章，成功后记录内容哈希，返回该文章的结果"""
+    response = update_lbc_article(job['article_id'], job['content'])
+    result = {
+        'file': job['file'],
+        'article_id': job['article_id'],
+        'status': 'success' if response['ok'] else 'fail',
+        'bytes': job['bytes'],
+        'attempts': response['attempts'],
+        'elapsed': response['elapsed'],
+        'error': response['error'],
+    }
+    if response['ok']:
+        get_store(PUBLISHED_ARTICLES_FILE).update(
+            job['file'],
+            content_sha256=job['digest'],
+            synced_at=datetime.now().isoformat()
+        )
+    return result
+
+
+def update_articles(article_files, dry_run=False, force=False, workers=4):
     """
     批量更新文章到 LBC
 
+    只推送内容与上次推送时不同的文章：发布记录中保存了上次推送内容的哈希，
+    哈希一致的文章直接跳过。需要推送的文章由 workers 个线程并发推送。
+
     Args:
         article_files: 要更新的文章文件路径列表
+        dry_run: 为 True 时只统计需要推送的文章，不实际请求
+        force: 为 True 时忽略内容哈希，推送全部文章
+        workers: 并发推送的线程数
+
+    Returns:
+        每篇文章的结果列表，每项为
+        {'file', 'article_id', 'status', 'bytes', 'attempts', 'elapsed', 'error'}，
+        status 为 'success'、'fail'、'skip'、'unchanged' 或 'dry-run'
     """
     published_articles = load_published_articles()
 
     if not published_articles:
         print("✗ 没有找到已发布的文章记录")
-        return 0
+        return []
 
     print(f"已加载 {len(published_articles)} 个已发布文章记录")
     print()
 
-    success_count = 0
-    skip_count = 0
-    fail_count = 0
+    results = []
+    jobs = []
+
+    def add_result(relative_path, status, article_id=None, size=0, error=None):
+        results.append({
+            'file': relative_path,
+            'article_id': article_id,
+            'status': status,
+            'bytes': size,
+            'attempts': 0,
+            'elapsed': 0.0,
+            'error': error,
+        })
 
     for i, file_path in enumerate(article_files, 1):
         print(f"[{i}/{len(article_files)}] 处理: {file_path.name}")
@@ -55,7 +98,7 @@ def update_articles(article_files):
         if relative_path not in published_articles:
             print(f"  ⚠️  文章未在发布记录中找到，跳过")
             print(f"     路径: {relative_path}")
-            skip_count += 1
+            add_result(relative_path, 'skip')
             print()
             continue
 
@@ -64,7 +107,7 @@ def update_articles(article_files):
 
         if not article_id:
             print(f"  ✗ 无法获取文章ID")
-            fail_count += 1
+            add_result(relative_path, 'fail', error='无法获取文章ID')
             print()
             continue
 
@@ -75,22 +118,68 @@ def update_articles(article_files):
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
+        except Exception as e:
+            print(f"  ✗ 读取文章失败: {e}")
+            add_result(relative_path, 'fail', article_id, error=str(e))
+            print()
+            continue
 
-            print(f"  读取文章内容: {len(content)} 字符")
-
-            # 调用更新函数
-            update_lbc_article(article_id, content)
+        digest = content_hash(content)
+        size = len(content.encode('utf-8'))
 
-            print(f"  ✓ 更新完成")
-            success_count += 1
+        # 内容与上次推送时相同，无需更新
+        if not force and digest == published_info.get('content_sha256'):
+            print(f"  ○ 内容未变化，跳过")
+            add_result(relative_path, 'unchanged', article_id, size)
+            print()
+            continue
 
-        except Exception as e:
-            print(f"  ✗ 更新失败: {e}")
-            fail_count += 1
+        print(f"  读取文章内容: {len(content)} 字符")
+        if dry_run:
+            print(f"  🔍 [DRY RUN] 将推送 {size} 字节")
+            add_result(relative_path, 'dry-run', article_id, size)
+        else:
+            jobs.append({
+                'file': relative_path,
+                'article_id': article_id,
+                'content': content,
+                'digest': digest,
+                'bytes': size,
+            })
+        print()
 
+    if jobs:
+        print(f"开始推送 {len(jobs)} 篇文章 (并发 {workers})...")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+            futures = {executor.submit(push_article, job): job for job in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {
+                        'file': job['file'],
+                        'article_id': job['article_id'],
+                        'status': 'fail',
+                        'bytes': job['bytes'],
+                        'attempts': 0,
+                        'elapsed': 0.0,
+                        'error': str(e),
+                    }
+                mark = '✓' if result['status'] == 'success' else '✗'
+                print(f"  [{done}/{len(jobs)}] {mark} {result['file']} "
+                      f"(尝试 {result['attempts']} 次，{result['elapsed']:.2f}秒)")
+                results.append(result)
         print()
 
-    return success_count, skip_count, fail_count
+    unchanged = [r for r in results if r['status'] == 'unchanged']
+    pushed_bytes = sum(r['bytes'] for r in results if r['status'] in ('success', 'fail', 'dry-run'))
+    print(f"增量同步: {len(unchanged)} 篇文章未变化，避免 {len(unchanged)} 次请求，"
+          f"节省上传 {sum(r['bytes'] for r in unchanged)} 字节；"
+          f"{'需' if dry_run else '已'}推送 {pushed_bytes} 字节")
+    print()
+
+    return results
 
 
 def main():
@@ -105,6 +194,10 @@ def main():
     )
     parser.add_argument('file', nargs='?', help='要更新的文章文件路径')
     parser.add_argument('--all', action='store_true', help='更新 published_articles.json 中的所有已发布文章')
+    parser.add_argument('--dry-run', action='store_true', help='只列出需要推送的文章及节省的流量，不实际更新')
+    parser.add_argument('--force', action='store_true', help='忽略内容哈希，推送所有指定的文章')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='并发推送的线程数，默认 4')
+    parser.add_argument('--report', help='把每篇文章的更新结果以 JSON 格式写入指定文件')
 
     args = parser.parse_args()
 
@@ -168,16 +261,43 @@ def main():
     print()
 
     # 更新文章
-    success_count, skip_count, fail_count = update_articles(files_to_update)
+    results = update_articles(
+        files_to_update, dry_run=args.dry_run, force=args.force, workers=max(1, args.workers)
+    )
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"更新结果已写入 {args.report}")
+
+    # 把本次追加的发布日志合并回 published_articles.json
+    get_store(PUBLISHED_ARTICLES_FILE).compact()
 
     # 输出结果
     print("=" * 60)
     print("更新完成！")
     print("=" * 60)
-    print(f"成功: {success_count} 个")
-    print(f"跳过: {skip_count} 个")
-    print(f"失败: {fail_count} 个")
+    if args.dry_run:
+        print(f"待推送: {counts.get('dry-run', 0)} 个")
+    else:
+        print(f"成功: {counts.get('success', 0)} 个")
+    print(f"跳过: {counts.get('skip', 0)} 个")
+    print(f"未变化: {counts.get('unchanged', 0)} 个")
+    print(f"失败: {counts.get('fail', 0)} 个")
     print(f"总计: {len(files_to_update)} 个")
+    if not args.dry_run:
+        print(f"LBC API: {format_metrics(get_client().metrics.snapshot())}")
+
+    failed = [r for r in results if r['status'] == 'fail']
+    if failed:
+        print()
+        print("失败的文章:")
+        for result in failed:
+            print(f"  ✗ {result['file']}: {result['error']}")
+        return 1
 
     return 0
 
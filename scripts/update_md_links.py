@@ -10,33 +10,198 @@ to replace local file references (e.g., 3_types.md) with published URLs
 import json
 import os
 import re
+import tempfile
 from pathlib import Path
 
+from content_cache import CACHE_DIR, content_hash
+from published_store import get_store
+
 
 def load_published_articles(json_path):
-    """Load published articles mapping from JSON file."""
-    with open(json_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """Load published articles mapping (JSON snapshot plus pending log entries)."""
+    return get_store(json_path).all()
+
+
+ARTICLE_URL = "https://learnblockchain.cn/article/{}"
+LINK_GRAPH_PATH = CACHE_DIR / 'link_graph.json'
+
+# Pattern to match markdown links: [text](path/to/file.md)
+# Captures: [1]=link text, [2]=full path including any ../
+LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+\.md)\)')
+
 
+def canonical_path(path, base_dir):
+    """
+    Return the path relative to the project root in POSIX form, or None if it
+    lies outside the project.
 
-def build_filename_to_url_map(published_data):
+    Example: /repo/docs/solidity-basic/../ethereum/1_a.md -> "docs/ethereum/1_a.md"
     """
-    Build a mapping from filename to published URL.
+    try:
+        return Path(os.path.normpath(path)).relative_to(base_dir).as_posix()
+    except ValueError:
+        return None
+
+
+def build_path_to_url_map(published_data, base_dir, script_dir):
+    """
+    Build a mapping from canonical docs path to published URL.
+
+    Published records are keyed by the path the article was published with,
+    which is relative to the project root or to scripts/.
 
     Returns:
-        dict: {filename: url, ...}
-        Example: {"3_types.md": "https://learnblockchain.cn/article/22531"}
+        dict: {canonical_path: url, ...}
+        Example: {"docs/solidity-basic/3_types.md": "https://learnblockchain.cn/article/22531"}
     """
-    filename_map = {}
+    path_map = {}
 
     for file_path, info in published_data.items():
-        # Extract just the filename from the path
-        filename = os.path.basename(file_path)
-        article_id = info['lbc_article_id']
-        url = f"https://learnblockchain.cn/article/{article_id}"
-        filename_map[filename] = url
+        candidates = [Path(file_path)] if os.path.isabs(file_path) else \
+            [base_dir / file_path, script_dir / file_path]
+        resolved = next((p for p in candidates if p.exists()), candidates[0])
+        target = canonical_path(resolved, base_dir)
+        if target is None:
+            continue
+        path_map[target] = ARTICLE_URL.format(info['lbc_article_id'])
 
-    return filename_map
+    return path_map
+
+
+def resolve_link(source, link, base_dir):
+    """Resolve a relative .md link in the source file to a canonical path."""
+    if '://' in link or link.startswith('/'):
+        return None
+    return canonical_path(base_dir / Path(source).parent / link, base_dir)
+
+
+def extract_link_targets(content, source, base_dir):
+    """Canonical paths of all local .md files linked from the content."""
+    targets = set()
+    for match in LINK_PATTERN.finditer(content):
+        target = resolve_link(source, match.group(2), base_dir)
+        if target:
+            targets.add(target)
+    return targets
+
+
+class LinkGraph:
+    """
+    Persistent link graph between markdown files.
+
+    For every source file it records the local .md targets it links to and the
+    targets whose links were already rewritten to published URLs; the reverse
+    index maps each target back to the files referencing it. Together with the
+    URL mapping applied on the last run, this tells which files need to be
+    rewritten when published articles are added or change.
+    """
+
+    def __init__(self, path, base_dir):
+        self.path = Path(path)
+        self.base_dir = base_dir
+        self.files = {}
+        self.applied = {}  # canonical target -> URL written on the last run
+        self._load()
+        self.reverse = self._build_reverse()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('base_dir') == str(self.base_dir):
+                self.files = data.get('files', {})
+                self.applied = data.get('applied', {})
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable link graph {self.path}: {e}")
+
+    def _build_reverse(self):
+        reverse = {}
+        for source, entry in self.files.items():
+            for target in list(entry['targets']) + list(entry['linked']):
+                reverse.setdefault(target, set()).add(source)
+        return reverse
+
+    def _unlink(self, source):
+        entry = self.files.pop(source, None)
+        if entry:
+            for target in list(entry['targets']) + list(entry['linked']):
+                sources = self.reverse.get(target)
+                if sources:
+                    sources.discard(source)
+
+    def update_file(self, file_path, content, linked=None):
+        """Record the current content of a file and the targets it links to."""
+        source = canonical_path(file_path, self.base_dir)
+        old = self.files.get(source, {})
+        linked = dict(old.get('linked', {}), **(linked or {}))
+        self._unlink(source)
+
+        stat = os.stat(file_path)
+        entry = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'content': content_hash(content),
+            'targets': sorted(extract_link_targets(content, source, self.base_dir)),
+            'linked': linked,
+        }
+        self.files[source] = entry
+        for target in entry['targets'] + list(entry['linked']):
+            self.reverse.setdefault(target, set()).add(source)
+
+    def is_fresh(self, file_path):
+        """True if the file is unchanged since it was last recorded."""
+        entry = self.files.get(canonical_path(file_path, self.base_dir))
+        if not entry:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        with open(file_path, 'rb') as f:
+            if content_hash(f.read()) != entry['content']:
+                return False
+        entry['size'] = stat.st_size
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def forget_missing(self, md_files):
+        """Drop files that no longer exist from the graph."""
+        present = {canonical_path(p, self.base_dir) for p in md_files}
+        for source in [s for s in self.files if s not in present]:
+            self._unlink(source)
+
+    def changed_targets(self, path_to_url):
+        """Targets that were published or whose URL changed since the last run."""
+        return {target for target, url in path_to_url.items() if self.applied.get(target) != url}
+
+    def referencing_files(self, targets):
+        sources = set()
+        for target in targets:
+            sources.update(self.reverse.get(target, ()))
+        return sources
+
+    def save(self, path_to_url):
+        """Persist the graph along with the URL mapping that was applied."""
+        self.applied = dict(path_to_url)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'base_dir': str(self.base_dir),
+            'applied': self.applied,
+            'files': self.files,
+            'reverse': {target: sorted(sources) for target, sources in self.reverse.items() if sources},
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
 
 
 def find_all_markdown_files(base_dir):
@@ -50,7 +215,7 @@ def find_all_markdown_files(base_dir):
     return md_files
 
 
-def update_markdown_links(content, filename_to_url):
+def update_markdown_links(content, path_to_url, source, base_dir, url_updates=None):
     """
     Update markdown links in content.
 
@@ -60,47 +225,87 @@ def update_markdown_links(content, filename_to_url):
     - [text](../solidity-basic/3_types.md)
     - [text](../../ethereum/1_ethereum_basics.md)
 
+    Links are resolved relative to the source file, so files with the same
+    name in different sections map to their own URLs.
+
     Args:
         content: markdown file content
-        filename_to_url: mapping of filename to published URL
+        path_to_url: mapping of canonical docs path to published URL
+        source: canonical path of the file being updated
+        base_dir: project root
+        url_updates: {old_url: new_url} for already rewritten links whose
+            article was republished under a new URL
 
     Returns:
-        tuple: (updated_content, changes_made)
+        tuple: (updated_content, changes_made, linked) where linked maps the
+        canonical targets now linked by URL to that URL
     """
     changes = []
-
-    # Pattern to match markdown links: [text](path/to/file.md)
-    # Captures: [1]=link text, [2]=full path including any ../
-    link_pattern = re.compile(r'\[([^\]]+)\]\(([^)]+\.md)\)')
+    linked = {}
 
     def replace_link(match):
         link_text = match.group(1)
         original_path = match.group(2)
 
-        # Extract just the filename from the path
-        filename = os.path.basename(original_path)
-
         # Check if we have a published URL for this file
-        if filename in filename_to_url:
-            new_url = filename_to_url[filename]
+        target = resolve_link(source, original_path, base_dir)
+        if target in path_to_url:
+            new_url = path_to_url[target]
             changes.append(f"  {original_path} -> {new_url}")
+            linked[target] = new_url
             return f"[{link_text}]({new_url})"
 
         # If no mapping found, keep original
         return match.group(0)
 
-    updated_content = link_pattern.sub(replace_link, content)
+    updated_content = LINK_PATTERN.sub(replace_link, content)
+
+    for old_url, new_url in (url_updates or {}).items():
+        old_link = f"]({old_url})"
+        count = updated_content.count(old_link)
+        if count:
+            updated_content = updated_content.replace(old_link, f"]({new_url})")
+            changes.extend([f"  {old_url} -> {new_url}"] * count)
+
+    return updated_content, changes, linked
+
+
+def update_file_links(content, path_to_url, source, base_dir, graph=None):
+    """
+    Update the links of one file, including links that an earlier run already
+    rewrote to a URL that has since changed (as recorded in the link graph).
+
+    Args:
+        content: markdown file content
+        path_to_url: mapping of canonical docs path to published URL
+        source: canonical path of the file being updated
+        base_dir: project root
+        graph: LinkGraph holding the links rewritten by earlier runs, or None
 
-    return updated_content, changes
+    Returns:
+        tuple: (updated_content, changes_made, linked) as for update_markdown_links
+    """
+    linked_before = graph.files.get(source, {}).get('linked', {}) if graph is not None else {}
+    url_updates = {url: path_to_url[target] for target, url in linked_before.items()
+                   if target in path_to_url and path_to_url[target] != url}
 
+    updated_content, changes, linked = update_markdown_links(
+        content, path_to_url, source, base_dir, url_updates)
+    for target, url in linked_before.items():
+        if url in url_updates:
+            linked[target] = url_updates[url]
+    return updated_content, changes, linked
 
-def process_file(file_path, filename_to_url, dry_run=False):
+
+def process_file(file_path, path_to_url, base_dir, graph=None, dry_run=False):
     """
     Process a single markdown file.
 
     Args:
         file_path: Path to the markdown file
-        filename_to_url: mapping of filename to URL
+        path_to_url: mapping of canonical docs path to URL
+        base_dir: project root
+        graph: LinkGraph to update with the file's links
         dry_run: if True, don't actually write changes
 
     Returns:
@@ -109,10 +314,12 @@ def process_file(file_path, filename_to_url, dry_run=False):
     with open(file_path, 'r', encoding='utf-8') as f:
         original_content = f.read()
 
-    updated_content, changes = update_markdown_links(original_content, filename_to_url)
+    source = canonical_path(file_path, base_dir)
+    updated_content, changes, linked = update_file_links(
+        original_content, path_to_url, source, base_dir, graph)
 
     if changes:
-        print(f"\n📝 {file_path.relative_to(file_path.parent.parent.parent)}:")
+        print(f"\n📝 {source}:")
         for change in changes:
             print(change)
 
@@ -123,9 +330,10 @@ def process_file(file_path, filename_to_url, dry_run=False):
         else:
             print(f"  🔍 [DRY RUN] Would update {len(changes)} link(s)")
 
-        return len(changes)
+    if graph is not None and not dry_run:
+        graph.update_file(file_path, updated_content, linked)
 
-    return 0
+    return len(changes)
 
 
 def main():
@@ -136,10 +344,12 @@ def main():
                        help='Show what would be changed without actually changing files')
     parser.add_argument('--base-dir', default='..',
                        help='Base directory of the project (default: parent of scripts/)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Ignore the link graph and process every file')
     args = parser.parse_args()
 
     # Resolve paths
-    script_dir = Path(__file__).parent
+    script_dir = Path(__file__).resolve().parent
     base_dir = (script_dir / args.base_dir).resolve()
     json_path = script_dir / 'published_articles.json'
 
@@ -150,32 +360,48 @@ def main():
     published_data = load_published_articles(json_path)
     print(f"✅ Found {len(published_data)} published articles")
 
-    # Build filename to URL mapping
-    filename_to_url = build_filename_to_url_map(published_data)
-    print(f"🔗 Built mapping for {len(filename_to_url)} files\n")
+    # Build path to URL mapping
+    path_to_url = build_path_to_url_map(published_data, base_dir, script_dir)
+    print(f"🔗 Built mapping for {len(path_to_url)} files\n")
 
     # Find all markdown files
     md_files = find_all_markdown_files(base_dir)
-    print(f"🔍 Found {len(md_files)} markdown files to process")
+    print(f"🔍 Found {len(md_files)} markdown files")
 
     if args.dry_run:
         print("\n⚠️  DRY RUN MODE - No files will be modified\n")
 
+    # Only files that changed since the last run, plus files referencing
+    # newly published or re-published articles, need to be rewritten.
+    graph = LinkGraph(LINK_GRAPH_PATH, base_dir)
+    if args.no_cache:
+        to_process = md_files
+    else:
+        graph.forget_missing(md_files)
+        affected = graph.referencing_files(graph.changed_targets(path_to_url))
+        to_process = [p for p in md_files
+                      if canonical_path(p, base_dir) in affected or not graph.is_fresh(p)]
+    print(f"🧭 {len(to_process)} file(s) to process, {len(md_files) - len(to_process)} skipped via link graph")
+
     # Process each file
     total_changes = 0
     files_changed = 0
 
-    for md_file in md_files:
-        changes = process_file(md_file, filename_to_url, dry_run=args.dry_run)
+    for md_file in to_process:
+        changes = process_file(md_file, path_to_url, base_dir, graph=graph, dry_run=args.dry_run)
         if changes > 0:
             total_changes += changes
             files_changed += 1
 
+    if not args.dry_run:
+        graph.save(path_to_url)
+
     # Summary
     print(f"\n{'='*60}")
     print(f"📊 Summary:")
     print(f"  Files changed: {files_changed}/{len(md_files)}")
     print(f"  Total links updated: {total_changes}")
+    print(f"  Skipped (unchanged, link graph): {len(md_files) - len(to_process)}")
 
     if args.dry_run:
         print(f"\n💡 Run without --dry-run to apply changes")
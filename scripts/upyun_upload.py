@@ -1,9 +1,20 @@
 import upyun
+import upyun.resume
+import collections.abc
 import os
+import json
 import requests
+import tempfile
+import threading
 import time
-import random
+import types
+import hashlib
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from requests.adapters import HTTPAdapter
 
+from config import IMAGE_CDN_PREFIX
 from dotenv import load_dotenv
 load_dotenv(".env")
 
@@ -13,103 +24,457 @@ password = os.getenv('UPYUN_PASSWORD')
 if not username or not password:
     raise ValueError("请设置 UPYUN_USERNAME 和 UPYUN_PASSWORD 环境变量")
 
+UPYUN_BUCKET = "image-learnblog"
+CDN_PREFIX = IMAGE_CDN_PREFIX
 
+# 源图片 URL -> CDN URL 的索引，已迁移过的图片不再下载
+IMAGE_INDEX_FILE = Path(__file__).parent / "uploaded_images.json"
 
-def get_filename(image_url):
-    # 获取图片名称
-    filename = image_url.split("/")[-1]
+DEFAULT_UPLOAD_WORKERS = 8
+REQUEST_TIMEOUT = 60
 
-    # 判断是否以图片格式结尾
-    if filename.endswith(".png") or \
-        filename.endswith(".jpg") or \
-        filename.endswith(".jpeg") or \
-        filename.endswith(".gif") or \
-        filename.endswith(".webp") or \
-        filename.endswith(".mp4") or \
-        filename.endswith(".svg") :
+# 流式传输：每次读写的块大小，超过 MULTIPART_THRESHOLD 的文件使用分块上传
+STREAM_CHUNK_SIZE = 64 * 1024
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_PART_SIZE = 1024 * 1024  # 又拍云要求分块大小为 1MB 的整数倍
+PROGRESS_MIN_SIZE = 1024 * 1024  # 超过该大小的传输才输出进度
 
-        if len(filename) > 50:
-            filename = filename[len(filename)-50:]
-        elif len(filename) < 5:
-            random_num = str(random.randint(100, 999))
-            filename = random_num + "_" + filename
+_local = threading.local()
+_session = None
+_session_lock = threading.Lock()
 
-        # 在原文名的基础上去掉特殊字符
-        filename = filename.replace("*", "").replace("?", "").replace(":", "").replace("|", "")
-        filename = filename.replace("\\", "").replace("/", "").replace(" ", "").replace("%", "")
 
-    
+def get_upyun():
+    """获取当前线程复用的 UpYun 客户端（每个客户端内部持有自己的连接）"""
+    up = getattr(_local, 'upyun', None)
+    if up is None:
+        up = _local.upyun = upyun.UpYun(UPYUN_BUCKET,
+                                        username,
+                                        password,
+                                        timeout=REQUEST_TIMEOUT,
+                                        endpoint=upyun.ED_AUTO,
+                                        chunksize=STREAM_CHUNK_SIZE)
+    return up
+
+
+def get_session():
+    """获取共用的 HTTP 会话，用于下载源图片和检查 CDN 上的文件"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=DEFAULT_UPLOAD_WORKERS * 2)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+class ImageIndex:
+    """持久化的 源图片 URL -> CDN URL 索引，可在多个线程中共用"""
+
+    def __init__(self, path=IMAGE_INDEX_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"读取图片索引 {self.path} 时出错，将忽略索引: {e}")
+            return {}
+
+    def get(self, image_url):
+        with self._lock:
+            return self._entries.get(image_url)
+
+    def put(self, image_url, cdn_url):
+        with self._lock:
+            if self._entries.get(image_url) != cdn_url:
+                self._entries[image_url] = cdn_url
+                self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self):
+        """原子地写回索引文件"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+            self._dirty = False
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """获取进程内共用的图片索引"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ImageIndex()
+        return _index
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.avif', '.heic', '.heif', '.mp4', '.mov')
+CONTENT_KEY_PREFIX = "sha256/"
+
+# ISO BMFF（ftyp 盒）的主品牌 -> 扩展名，未列出的品牌不做猜测
+FTYP_BRAND_EXTENSIONS = {
+    b'avif': '.avif', b'avis': '.avif',
+    b'heic': '.heic', b'heix': '.heic', b'hevc': '.heic', b'hevx': '.heic',
+    b'mif1': '.heif', b'msf1': '.heif',
+    b'qt  ': '.mov',
+    b'isom': '.mp4', b'iso2': '.mp4', b'iso4': '.mp4', b'iso5': '.mp4', b'iso6': '.mp4',
+    b'mp41': '.mp4', b'mp42': '.mp4', b'avc1': '.mp4', b'dash': '.mp4', b'M4V ': '.mp4',
+}
+
+
+def sniff_extension(head):
+    """根据文件开头的魔数判断扩展名，无法识别时返回 None"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return '.gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head[4:8] == b'ftyp':
+        return FTYP_BRAND_EXTENSIONS.get(head[8:12])
+    text = head[:1024].lstrip().lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+        return '.svg'
+    return None
+
+
+def url_extension(image_url):
+    """从 URL 路径中猜测扩展名，无法识别时返回 .jpg"""
+    path = image_url.split("?")[0].split("#")[0].lower()
+    for ext in IMAGE_EXTENSIONS:
+        if path.endswith(ext):
+            return ext
+    return '.jpg'
+
+
+def hash_file(f):
+    """流式计算已打开文件的 SHA-256，返回 (摘要, 文件开头的字节)，读取后把位置重置到开头"""
+    digest = hashlib.sha256()
+    head = b''
+    for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+        if not head:
+            head = chunk[:1024]
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest(), head
+
+
+def get_filename(digest, head, image_url=""):
+    """
+    按内容生成对象名：sha256/<前两位>/<SHA-256><扩展名>
+
+    相同内容的文件无论来源和上传日期都对应同一个对象。扩展名优先根据文件内容判断，
+    无法识别时才从 URL 猜测。
+    """
+    ext = sniff_extension(head) or url_extension(image_url)
+    return f"{CONTENT_KEY_PREFIX}{digest[:2]}/{digest}{ext}"
+
+
+class TransferProgress:
+    """传输进度和吞吐统计，较大的文件每完成 10% 输出一次进度"""
+
+    def __init__(self, label, total, action="上传"):
+        self.label = label
+        self.total = total
+        self.action = action
+        self.done = 0
+        self.started = time.monotonic()
+        self._reported = 0
+        self._finished = False
+        self.verbose = total is None or total >= PROGRESS_MIN_SIZE
+
+    def update(self, done):
+        self.done = done
+        if not self.verbose or not self.total:
+            return
+        percent = done * 100 // self.total
+        if percent >= self._reported + 10 and done < self.total:
+            self._reported = percent - percent % 10
+            print(f"  {self.action} {self.label}: {percent}% ({done / 1024 / 1024:.1f}MB)")
+
+    def advance(self, size):
+        self.update(self.done + size)
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self.total:
+            self.done = self.total
+        if self.verbose:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            print(f"  {self.action} {self.label} 完成: {self.done / 1024 / 1024:.1f}MB，"
+                  f"{self.done / 1024 / 1024 / elapsed:.2f}MB/s")
+
+    # upyun 普通上传的 handler 接口
+    def __call__(self, total, params=None):
+        self.total = total
+        return self
+
+    # upyun 分块上传的 reporter 接口
+    def report(self, uploaded, total, done):
+        self.update(uploaded)
+        if done:
+            self.finish()
+
+
+def _resume_compat():
+    """upyun SDK 的分块上传（upyun.resume）用到了 Python 3.10 起已移除的 collections.Callable
+
+    只替换 upyun.resume 模块中的 collections 名称，不修改标准库，在第一次分块上传前调用
+    """
+    if not hasattr(upyun.resume.collections, 'Callable'):
+        upyun.resume.collections = types.SimpleNamespace(Callable=collections.abc.Callable)
+
+
+def put_file(key, f, size, label=None):
+    """
+    把已打开的文件流式上传到又拍云，内存占用只与块大小有关
+
+    小文件按块读取后单次 PUT，大文件使用分块上传。
+    """
+    progress = TransferProgress(label or key, size)
+    if size >= MULTIPART_THRESHOLD:
+        # 分块上传默认根据本地文件名推断类型，这里改为按对象名推断
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        _resume_compat()
+        get_upyun().put(key, f, need_resume=True, part_size=MULTIPART_PART_SIZE,
+                        reporter=progress.report, headers={'X-Upyun-Multi-Type': content_type})
     else:
-        # 生产一个 8 为的随机数
-        random_num = str(random.randint(10000000, 99999999))
-        if "webp" in filename:
-            filename = random_num + "_image.webp"
-        elif "svg" in filename:
-            filename = random_num + "_image.svg"
-        elif "gif" in filename:
-            filename = random_num + "_image.gif"
-        elif "png" in filename:
-            filename = random_num + "_image.png"
-        elif "jpeg" in filename:
-            filename = random_num + "_image.jpeg"
-        elif "mp4" in filename:
-            filename = random_num + "_video.mp4"
-        else:
-            filename = random_num + "_image.jpg"
-
-
-    filename = time.strftime('%Y/%m/%d/',time.localtime(time.time())) + filename
-    return filename
+        get_upyun().put(key, f, handler=progress)
+    progress.finish()
 
-def upload_img(image_url):
-    if image_url.startswith("https://img.learnblockchain.cn/"):
-        return image_url
 
-    up = upyun.UpYun("image-learnblog", 
-                    username, 
-                    password, 
-                    timeout=60, 
-                    endpoint=upyun.ED_AUTO)
+def download_to_tempfile(image_url):
+    """
+    以流式方式把源文件下载到临时文件，返回 (临时文件, 字节数)
+
+    下载失败时返回 (None, HTTP 状态码)。调用方负责关闭临时文件。
+    """
+    with get_session().get(image_url, stream=True, timeout=REQUEST_TIMEOUT) as r:
+        if r.status_code != 200:
+            return None, r.status_code
 
-    filename = get_filename(image_url)
-    upload_url = "https://img.learnblockchain.cn/" + filename
+        length = r.headers.get('Content-Length')
+        progress = TransferProgress(image_url, int(length) if length and length.isdigit() else None, "下载")
+        tmp = tempfile.NamedTemporaryFile()
+        try:
+            for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                tmp.write(chunk)
+                progress.advance(len(chunk))
+            tmp.flush()
+            size = tmp.tell()
+            tmp.seek(0)
+        except Exception:
+            tmp.close()
+            raise
+        progress.total = size
+        progress.finish()
+        return tmp, size
 
-    # 如果图片可访问，说明已经上传过，则直接返回
+
+def exists_on_cdn(upload_url):
+    """用 HEAD 请求检查 CDN 上是否已有该文件，不下载文件内容"""
     try:
-        r = requests.get(upload_url)
-        if r.status_code == 200:
-            return upload_url;
-    except Exception as e:
-        pass
+        r = get_session().head(upload_url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+        return r.status_code == 200
+    except requests.RequestException:
+        return False
+
+
+_uploaded_keys = set()
+_uploaded_keys_lock = threading.Lock()
+_key_locks = {}
+
+
+def _key_lock(filename):
+    with _uploaded_keys_lock:
+        return _key_locks.setdefault(filename, threading.Lock())
+
+
+def is_uploaded(filename):
+    """检查按内容命名的对象是否已上传：先查本进程的记录，再用 HEAD 请求检查 CDN"""
+    with _uploaded_keys_lock:
+        if filename in _uploaded_keys:
+            return True
+    if exists_on_cdn(CDN_PREFIX + filename):
+        mark_uploaded(filename)
+        return True
+    return False
+
+
+def mark_uploaded(filename):
+    with _uploaded_keys_lock:
+        _uploaded_keys.add(filename)
+
+
+def _put_content_addressed(f, size, image_url, label=None):
+    """按内容命名上传已打开的文件，返回 (对象名, 是否新上传)"""
+    filename = get_filename(*hash_file(f), image_url=image_url)
+
+    # 同一内容同时只上传一次；对象已经存在时无需重复上传
+    with _key_lock(filename):
+        if is_uploaded(filename):
+            return filename, False
+        put_file(filename, f, size, label=label or filename)
+        mark_uploaded(filename)
+    return filename, True
+
+
+def _put_optimized(src_path, size, image_url, optimize):
+    """
+    压缩后再上传
+
+    文档只引用主文件，不生成 WebP / AVIF 版本（没有页面引用它们，上传了也只是占用空间）
+
+    Returns:
+        (对象名, 是否新上传, 上传的字节数)
+    """
+    import image_optimize
+
+    optimized = image_optimize.optimize_in_pool(src_path, dict(optimize, webp=False, avif=False))
+    with open(optimized['path'], 'rb') as f:
+        filename, uploaded = _put_content_addressed(f, optimized['optimized'], image_url)
+    sent = optimized['optimized'] if uploaded else 0
+
+    if optimized['optimized'] < size:
+        print(f"  压缩 {filename}: {size} -> {optimized['optimized']} 字节")
+    return filename, uploaded, sent
+
+
+def _upload_one(image_url, index, optimize=None):
+    """
+    迁移单张图片，optimize 为 image_optimize.make_options() 的结果时先压缩再上传
+
+    Returns:
+        (cdn_url, status, size): status 为 'skip'（已在 CDN 上）、'cached'（索引命中）、
+        'exists'（CDN 上已有相同内容的文件）、'uploaded' 或 'failed'，size 为本次上传的字节数
+    """
+    if image_url.startswith(CDN_PREFIX):
+        return image_url, 'skip', 0
+
+    cdn_url = index.get(image_url)
+    if cdn_url:
+        return cdn_url, 'cached', 0
 
     try:
-        r = requests.get(image_url)
-        if r.status_code == 200:
-            up.put(filename, r.content)
-            return upload_url;
-        else:
-            print(f"上传图片失败: {r.status_code}")
-            return None
-                    
+        tmp, result = download_to_tempfile(image_url)
+        if tmp is None:
+            print(f"上传图片失败: {result}")
+            return None, 'failed', 0
+
+        with tmp:
+            if optimize is not None:
+                filename, uploaded, sent = _put_optimized(tmp.name, result, image_url, optimize)
+            else:
+                filename, uploaded = _put_content_addressed(tmp, result, image_url)
+                sent = result if uploaded else 0
+
+        upload_url = CDN_PREFIX + filename
+        index.put(image_url, upload_url)
+        return upload_url, 'uploaded' if uploaded else 'exists', sent
+
     except Exception as e:
         print(f"处理图片失败: {image_url}, 错误: {str(e)}")
-    
-    return None 
-
-
-def upload_imgfile(file_path):
-    up = upyun.UpYun("image-learnblog", 
-                    username, 
-                    password, 
-                    timeout=60, 
-                    endpoint=upyun.ED_AUTO)
-    
-    uploadFileName = get_filename("")
-    upload_url = "https://img.learnblockchain.cn/" + uploadFileName
-
-    with open(file_path, "rb") as f:
-        up.put(uploadFileName, f.read())
-    print(f"上传图片成功: {upload_url}")
+
+    return None, 'failed', 0
+
+
+def upload_img(image_url):
+    """迁移单张图片到又拍云，返回 CDN URL，失败时返回 None"""
+    index = get_index()
+    cdn_url, status, _ = _upload_one(image_url, index)
+    if status in ('exists', 'uploaded'):
+        index.save()
+    return cdn_url
+
+
+def upload_imgs(image_urls, workers=DEFAULT_UPLOAD_WORKERS, optimize=None):
+    """
+    并发迁移多张图片到又拍云
+
+    重复的 URL 只处理一次；索引中已有的图片直接返回 CDN URL，不再下载。
+
+    Args:
+        image_urls: 源图片 URL 列表
+        workers: 并发数
+        optimize: image_optimize.make_options() 的结果，上传前压缩图片；None 表示原样上传
+
+    Returns:
+        dict: {源图片 URL: CDN URL}，失败的图片对应 None
+    """
+    index = get_index()
+    urls = list(dict.fromkeys(image_urls))
+    results = {}
+    stats = {'skip': 0, 'cached': 0, 'exists': 0, 'uploaded': 0, 'failed': 0}
+    uploaded_bytes = 0
+    started = time.monotonic()
+
+    if not urls:
+        return results
+
+    if optimize is not None:
+        import image_optimize
+        image_optimize.start_pool()  # 在上传线程启动前 fork 压缩进程
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as executor:
+            futures = {executor.submit(_upload_one, url, index, optimize): url for url in urls}
+            for future in as_completed(futures):
+                cdn_url, status, size = future.result()
+                results[futures[future]] = cdn_url
+                stats[status] += 1
+                uploaded_bytes += size
+    finally:
+        index.save()
+
+    print(f"图片迁移: 共 {len(urls)} 张，索引命中 {stats['cached']}，CDN 已存在 {stats['exists']}，"
+          f"新上传 {stats['uploaded']}，失败 {stats['failed']}")
+    if uploaded_bytes:
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"  上传 {uploaded_bytes / 1024 / 1024:.1f}MB，平均 {uploaded_bytes / 1024 / 1024 / elapsed:.2f}MB/s")
+    return results
+
+
+def upload_imgfile(file_path, optimize=None):
+    if optimize is not None:
+        uploadFileName, uploaded, _ = _put_optimized(file_path, os.path.getsize(file_path), str(file_path), optimize)
+    else:
+        with open(file_path, "rb") as f:
+            uploadFileName, uploaded = _put_content_addressed(f, os.fstat(f.fileno()).st_size, str(file_path),
+                                                              label=str(file_path))
+    upload_url = CDN_PREFIX + uploadFileName
+
+    if uploaded:
+        print(f"上传图片成功: {upload_url}")
+    else:
+        print(f"图片已存在: {upload_url}")
     return upload_url
 
 